@@ -0,0 +1,246 @@
+import os.path
+import argparse
+import numpy as np
+from time import time
+from functools import partial
+from multiprocessing import Pool
+from Utils import meta_file_name, train_test_mask, axis_stats, normalize_axes, NORMALIZE_MODES
+from Dataset import ProcessedFile
+
+TITLE = ("\n\t\t\t\t\t################"
+         "\n\t\t\t\t\t# Augment Data #"
+         "\n\t\t\t\t\t################\n")
+
+# All transforms take and return processed data of shape (3, recordings, 1, review_length)
+
+def interpolate(data, positions):
+    """
+    Linear interpolation of every recording at fractional sample positions
+    @param data      : Array of shape (3, recordings, 1, length)
+    @param positions : Array of shape (recordings, samples) with positions between 0 and length-1
+    @return          : Array of shape (3, recordings, 1, samples)
+    """
+    length = data.shape[-1]
+    positions = np.clip(positions, 0, length-1)
+    left = np.minimum(positions.astype(np.int64), max(length-2, 0))
+    right = np.minimum(left+1, length-1)
+    weight = (positions-left)[np.newaxis, :, np.newaxis, :]
+    shape = data.shape[:3]+positions.shape[-1:]
+    left_values = np.take_along_axis(data, np.broadcast_to(left[np.newaxis, :, np.newaxis, :], shape), axis=-1)
+    right_values = np.take_along_axis(data, np.broadcast_to(right[np.newaxis, :, np.newaxis, :], shape), axis=-1)
+    return left_values+(right_values-left_values)*weight
+
+def time_warp(data, random, sigma=0.2, knots=4):
+    """
+    Plays each recording with a smoothly changing speed
+    @param sigma : Standard deviation of the speed at the knots (1 = original speed)
+    @param knots : Number of inner points where the speed changes
+    """
+    recordings, length = data.shape[1], data.shape[-1]
+    speeds = np.clip(random.normal(1, sigma, (recordings, knots+2)), 0.1, None)
+    grid = np.linspace(0, knots+1, length)
+    knot = np.minimum(grid.astype(np.int64), knots)
+    speed = speeds[:, knot]+(speeds[:, knot+1]-speeds[:, knot])*(grid-knot)    # Speed of every sample
+    warped = np.cumsum(speed, axis=-1)
+    warped -= warped[:, :1]
+    warped *= (length-1)/warped[:, -1:]                                        # Same start and end as the recording
+    return interpolate(data, warped)
+
+def scale(data, random, sigma=0.1):
+    """
+    Scales each axis of each recording around its mean
+    @param sigma : Standard deviation of the scaling factors
+    """
+    factors = random.normal(1, sigma, data.shape[:2]+(1, 1))
+    mean = data.mean(axis=-1, keepdims=True)
+    return mean+(data-mean)*factors
+
+def rotate(data, random, max_angle=15):
+    """
+    Rotates the (x, y, z) vectors of each recording around a random axis through their mean
+    @param max_angle : Maximum rotation angle in degrees
+    """
+    recordings = data.shape[1]
+    axes = random.normal(size=(recordings, 3))
+    axes /= np.linalg.norm(axes, axis=-1, keepdims=True)
+    angles = np.radians(random.uniform(-max_angle, max_angle, recordings))[:, np.newaxis, np.newaxis]
+    # Rodrigues' formula: R = I + sin(a)*K + (1-cos(a))*K^2 with the cross product matrix K of the axis
+    cross = np.zeros((recordings, 3, 3))
+    cross[:, 0, 1], cross[:, 0, 2], cross[:, 1, 2] = -axes[:, 2], axes[:, 1], -axes[:, 0]
+    cross -= cross.transpose(0, 2, 1)
+    rotation = np.eye(3)+np.sin(angles)*cross+(1-np.cos(angles))*(cross @ cross)
+    center = data.mean(axis=-1, keepdims=True)
+    return np.einsum("nij,jnkl->inkl", rotation, data-center)+center
+
+def jitter(data, random, sigma=0.01):
+    """
+    Adds gaussian noise to every sample
+    @param sigma : Standard deviation of the noise
+    """
+    return data+random.normal(0, sigma, data.shape)
+
+def padding_lengths(data):
+    """
+    Returns the number of padded samples at the start and at the end of each recording
+    @return : (start padding, end padding) arrays; padding repeats the first or the last sample of all axes
+    """
+    length = data.shape[-1]
+    same_start = np.all(data == data[..., :1], axis=0)[:, 0]                  # Shape: (recordings, length)
+    same_end = np.all(data == data[..., -1:], axis=0)[:, 0]
+    start = np.where(same_start.all(axis=-1), length, np.argmin(same_start, axis=-1))-1
+    end = np.where(same_end.all(axis=-1), length, np.argmin(same_end[:, ::-1], axis=-1))-1
+    return np.maximum(start, 0), np.maximum(end, 0)
+
+def shift(data, random):
+    """
+    Moves each recording by a random number of samples within its padding; no sample of the recording is lost
+    """
+    length = data.shape[-1]
+    start, end = padding_lengths(data)
+    offsets = np.floor(random.uniform(-end, start+1)).astype(np.int64)
+    indexes = np.clip(np.arange(length)+offsets[:, np.newaxis], 0, length-1)
+    return np.take_along_axis(data, np.broadcast_to(indexes[np.newaxis, :, np.newaxis, :], data.shape), axis=-1)
+
+def normalize_batch(data, mode="global", padding=None):
+    """
+    Normalizes each recording again like the processed data (Utils.normalize_axes)
+    @param mode    : "global", "axis" or "standard"; normalization mode of the processed data
+    @param padding : (start, end) padding_lengths of data; None to compute the statistics from all samples
+    """
+    rows = data[:, :, 0].transpose(1, 0, 2)                                     # Shape: (recordings, 3, length)
+    valid = None
+    if padding is not None:
+        index = np.arange(rows.shape[-1])
+        valid = ((index >= padding[0][:, np.newaxis]) & (index < rows.shape[-1]-padding[1][:, np.newaxis]))[:, np.newaxis]
+    rows = normalize_axes(rows, mode=mode, stats=axis_stats(rows, valid=valid))
+    return rows.transpose(1, 0, 2)[:, :, np.newaxis]
+
+class Augmenter(object):
+    """
+    Random transforms applied to whole batches; picklable for worker processes
+    """
+    def __init__(self, warp=0.2, scaling=0.1, rotation=15, noise=0.01, shifting=True, normalize=True, seed=None,
+                 normalizeMode="global"):
+        """
+        @param warp          : Speed deviation of time_warp; 0 to disable
+        @param scaling       : Standard deviation of the axis scaling; 0 to disable
+        @param rotation      : Maximum rotation angle in degrees; 0 to disable
+        @param noise         : Standard deviation of the jitter; 0 to disable
+        @param shifting      : True to shift the recordings within their padding
+        @param normalize     : True to normalize the recordings again after the transforms
+        @param seed          : Seed of the random transforms
+        @param normalizeMode : "global", "axis" or "standard"; same as for the processed data
+        """
+        self.warp = warp
+        self.scaling = scaling
+        self.rotation = rotation
+        self.noise = noise
+        self.shifting = shifting
+        self.normalize = normalize
+        self.normalizeMode = normalizeMode
+        self.random = np.random.RandomState(seed)
+
+    def __call__(self, data, random=None):
+        """
+        @param data   : Array of shape (3, recordings, 1, review_length)
+        @param random : numpy.random.RandomState; None for the state of this Augmenter
+        @return       : Augmented copy of data
+        """
+        random = random or self.random
+        data = np.asarray(data, dtype=np.float64)
+        if self.shifting:
+            data = shift(data, random)                                          # Before the padding is changed
+        if self.warp:
+            data = time_warp(data, random, sigma=self.warp)
+        if self.scaling:
+            data = scale(data, random, sigma=self.scaling)
+        if self.rotation:
+            data = rotate(data, random, max_angle=self.rotation)
+        # The padding stays constant until the jitter; the statistics leave it out like those of the processed data
+        padding = padding_lengths(data) if self.normalize else None
+        if self.noise:
+            data = jitter(data, random, sigma=self.noise)
+        return normalize_batch(data, mode=self.normalizeMode, padding=padding) if self.normalize else data
+
+def augment_rows(rows, f_name, review_length, pad_pos, augmenter, copies, seed):
+    """
+    Augmented copies of the given rows of a processed file; runs in the worker processes
+    @return : (data of shape (3, copies*rows, 1, review_length), labels)
+    """
+    data, labels = ProcessedFile(f_name).read(rows, review_length, pad_pos=pad_pos)
+    random = np.random.RandomState(seed)
+    data = np.concatenate([augmenter(data, random) for _ in range(copies)], axis=1)
+    return data, np.tile(labels, copies)
+
+class _star(object):
+    """
+    Calls a function with (rows, seed) tuples; picklable unlike a lambda
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, args):
+        return self.function(args[0], seed=args[1])
+
+def main(dataFile, outputFile, review_length, pad_pos, train_ratio, seed, copies, jobs, augmenter, chunk_size=256):
+    print(TITLE)
+    data_file = ProcessedFile(dataFile)
+    rows = np.flatnonzero(train_test_mask(data_file.labels, train_ratio=train_ratio, seed=seed))
+    total = len(rows)*(copies+1)
+    print(" Training recordings: {}, augmented copies: {}, total: {}".format(len(rows), copies, total))
+    # Training recordings followed by their augmented copies; written chunk by chunk
+    array = np.lib.format.open_memmap(outputFile, mode="w+", dtype=np.float32, shape=(total, 3, review_length))
+    labels = np.empty(total, dtype=np.int16)
+    chunks = [rows[start : start+chunk_size] for start in range(0, len(rows), chunk_size)]
+    pool = Pool(jobs if (jobs > 0) else os.cpu_count()) if (jobs != 1) else None
+    worker = partial(augment_rows, f_name=dataFile, review_length=review_length, pad_pos=pad_pos, augmenter=augmenter, copies=copies)
+    try:
+        position, sources = 0, list(rows)
+        for chunk in chunks:
+            data, _labels = data_file.read(chunk, review_length, pad_pos=pad_pos)
+            array[position : position+len(chunk)] = data[:, :, 0].transpose(1, 0, 2)
+            labels[position : position+len(chunk)] = _labels
+            position += len(chunk)
+        seeds = np.random.RandomState(seed).randint(2**31, size=len(chunks))
+        tasks = [(chunk, int(_seed)) for chunk, _seed in zip(chunks, seeds)]
+        results = pool.imap(_star(worker), tasks) if pool else map(_star(worker), tasks)
+        for i, (data, _labels) in enumerate(results):
+            array[position : position+len(_labels)] = data[:, :, 0].transpose(1, 0, 2)
+            labels[position : position+len(_labels)] = _labels
+            position += len(_labels)
+            sources.extend(np.tile(chunks[i], copies))
+            print(" Progress: {:>4}/{} chunks".format(i+1, len(chunks)), end="\r")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    array.flush()
+    del array
+    np.savez(meta_file_name(outputFile), labels=labels, lengths=np.full(total, review_length, dtype=np.int32),
+             sources=np.array(["{}:{}".format(os.path.basename(dataFile), row) for row in sources], dtype=str))
+    print("\n Saved: {}".format(outputFile))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data", help="Processed data file (.csv or .npy)", type=str, required=True)
+    parser.add_argument("-o", "--output", help="Output array file (.npy) with the training recordings and their copies", type=str, required=True)
+    parser.add_argument("-l", "--length", help="Review length of each axis", type=int, default=150)
+    parser.add_argument("-p", "--pad", help="Padding position", type=str, default="start", choices=("start", "end"))
+    parser.add_argument("-r", "--ratio", help="Training ratio; same as for training, the test recordings are not augmented", type=float, default=0.75)
+    parser.add_argument("-s", "--seed", help="Seed of the train/test split and the transforms", type=int, default=None)
+    parser.add_argument("-c", "--copies", help="Augmented copies of each training recording", type=int, default=4)
+    parser.add_argument("-j", "--jobs", help="Number of worker processes; 0 for all CPU cores", type=int, default=1)
+    parser.add_argument("--warp", help="Speed deviation of the time warp; 0 to disable", type=float, default=0.2)
+    parser.add_argument("--scale", help="Standard deviation of the axis scaling; 0 to disable", type=float, default=0.1)
+    parser.add_argument("--rotate", help="Maximum rotation angle in degrees; 0 to disable", type=float, default=15)
+    parser.add_argument("--jitter", help="Standard deviation of the noise; 0 to disable", type=float, default=0.01)
+    parser.add_argument("--no-shift", help="Do not shift the recordings within their padding", action="store_true")
+    parser.add_argument("--norm-mode", help="Normalization mode of the processed data (see Process Data.py)", type=str, default="global", choices=NORMALIZE_MODES)
+    args = parser.parse_args()
+    t0 = time()
+    augmenter = Augmenter(warp=args.warp, scaling=args.scale, rotation=args.rotate, noise=args.jitter, shifting=not args.no_shift,
+                          normalizeMode=args.norm_mode)
+    main(dataFile=args.data, outputFile=args.output, review_length=args.length, pad_pos=args.pad, train_ratio=args.ratio,
+         seed=args.seed, copies=args.copies, jobs=args.jobs, augmenter=augmenter)
+    print(" Time taken: {:.2f} s".format(time()-t0))
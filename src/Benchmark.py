@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from Dataset import BatchGenerator
+from Augment import Augmenter
+from Utils import (movingAvg, movingAvgBatch, MovingAvgStream, normalize, pad_constant, pad_indexes, resample_batch, uniform_split,
+                   load_raw_data, load_raw_batch, load_processed_csv, load_processed_arrays, save_processed_arrays,
+                   train_test_mask, LABELS)
+
+TITLE = ("\n\t\t\t\t\t#############"
+         "\n\t\t\t\t\t# Benchmark #"
+         "\n\t\t\t\t\t#############\n")
+
+def movingAvgLoop(data, window=5):
+    """
+    Reference moving average with one np.ma.average call per sample (previous Utils.movingAvg)
+    @param data   : 1D array
+    @param window : Window size for calculating average
+    @return       : Smooth 1D numpy array
+    """
+    return np.array([np.ma.average(data[i : i+window]) for i in range(len(data))])
+
+def load_processed_loop(f_name, review_length, pad_pos="end", train_ratio=0.75):
+    """
+    Reference row by row loader and label counter split (previous Utils.load_processed_data without one-hot labels)
+    @param f_name        : Processed csv file name
+    @param review_length : Padding length
+    @param pad_pos       : "start" or "end"
+    @param train_ratio   : Percentage of total data to use for training
+    @return              : (data, labels, train indexes)
+    """
+    with open(f_name, "r") as csv_file:
+        data = [[], [], []]
+        labels = []
+        for row in csv_file:
+            _data = list(map(float, row.split(",")))
+            _data, _label = np.array(_data[: -1]), _data[-1]
+            _data = uniform_split(_data, parts=3)
+            for i, axis_array in enumerate(_data):
+                axis_array = pad_constant(axis_array, max_length=review_length, pad_pos=pad_pos)
+                axis_array = np.reshape(axis_array, (1, axis_array.shape[0]))
+                data[i].append(axis_array)
+            labels.append(_label)
+    label_counter = {label:0 for label in set(labels)}
+    train_amount = round(train_ratio*len(labels)/len(set(labels)))
+    train_indexes = np.zeros(len(labels))
+    for i, label in enumerate(labels):
+        if label_counter[label] < train_amount:
+            label_counter[label] += 1
+            train_indexes[i] = 1
+            if all(count>=train_amount for count in label_counter.values()):
+                break
+    return np.array(data), np.array(labels), (train_indexes == 1)
+
+def write_processed_csv(f_name, numRecordings, numSamples, numLabels=5):
+    """
+    Writes a synthetic processed csv file; rows have x, y, z values of random length followed by a label
+    @param f_name        : Output file name
+    @param numRecordings : Number of rows
+    @param numSamples    : Maximum number of sample points per axis
+    @param numLabels     : Number of different labels
+    @return              : Nothing
+    """
+    with open(f_name, "w") as csv_file:
+        for _ in range(numRecordings):
+            data = np.random.rand(3*np.random.randint(numSamples-10, numSamples+1)+np.random.randint(0, 3))
+            csv_file.write("{},{}\n".format(",".join(map(str, data)), np.random.randint(numLabels)))
+
+def check_load_processed(f_name, review_length):
+    """
+    Checks load_processed_csv and train_test_mask against the reference loader
+    @param f_name        : Processed csv file name
+    @param review_length : Padding length
+    @return              : Nothing; raises AssertionError on mismatch
+    """
+    for pad_pos in ("start", "end"):
+        expected_data, expected_labels, expected_mask = load_processed_loop(f_name, review_length, pad_pos=pad_pos)
+        data, labels = load_processed_csv(f_name, review_length, pad_pos=pad_pos)
+        assert np.array_equal(data, expected_data)
+        assert np.array_equal(labels, expected_labels)
+        assert np.array_equal(train_test_mask(labels), expected_mask)
+    # Seeded split keeps the same amount of training data for each label
+    mask = train_test_mask(labels, seed=0)
+    assert np.array_equal(mask, train_test_mask(labels, seed=0))
+    assert np.array_equal(np.bincount(labels[mask].astype(int)), np.bincount(labels[expected_mask].astype(int)))
+
+def timeit(func, repeat=3):
+    """
+    Returns the best wall time of given function
+    @param func   : Function without arguments to time
+    @param repeat : Number of runs
+    @return       : Best run time (in seconds)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = perf_counter()
+        func()
+        best = min(best, perf_counter()-t0)
+    return best
+
+def check_movingAvg(recordings, window):
+    """
+    Checks movingAvg, movingAvgBatch and MovingAvgStream against the reference loop
+    @param recordings : Array of shape (recordings, 3, samples) with integer acceleration readings
+    @param window     : Moving average window width
+    @return           : Nothing; raises AssertionError on mismatch
+    """
+    expected = np.array([[movingAvgLoop(axis, window=window) for axis in recording] for recording in recordings])
+    assert np.array_equal(np.array([[movingAvg(axis, window=window) for axis in recording] for recording in recordings]), expected)
+    assert np.array_equal(movingAvgBatch(recordings, window=window), expected)
+    # Ragged recordings padded to a common length
+    lengths = np.random.randint(1, recordings.shape[-1]+1, size=recordings.shape[:-1])
+    batch = movingAvgBatch(recordings, window=window, lengths=lengths)
+    for index in np.ndindex(*lengths.shape):
+        length = lengths[index]
+        assert np.array_equal(batch[index][:length], movingAvgLoop(recordings[index][:length], window=window))
+    # Stream fed with chunks of random size
+    stream = MovingAvgStream(window=window)
+    chunks, start = [], 0
+    while start < recordings.shape[-1]:
+        stop = start+np.random.randint(1, 2*window)
+        chunks.append(stream.push(recordings[..., start:stop]))
+        start = stop
+    chunks.append(stream.flush())
+    assert np.array_equal(np.concatenate(chunks, axis=-1), expected)
+
+def write_raw_files(dataDir, recordings, files_per_session=10):
+    """
+    Writes synthetic recordings like RAW_Data; session directories "{Label} 01 01 2019 00-00" with "{Label}{i}.csv" files
+    @param dataDir           : Output directory
+    @param recordings        : Array of shape (recordings, 3, samples) with integer acceleration readings
+    @param files_per_session : Number of files in each session directory
+    @return                  : List of file names
+    """
+    f_names = []
+    for i, recording in enumerate(recordings):
+        session, index = divmod(i, files_per_session)
+        label = LABELS[session % len(LABELS)].capitalize()
+        session_dir = os.path.join(dataDir, "{} 01 01 2019 {:02d}-{:02d}".format(label, *divmod(session, 60)))
+        os.makedirs(session_dir, exist_ok=True)
+        f_name = os.path.join(session_dir, "{}{}.csv".format(label, index))
+        np.savetxt(f_name, recording.T, fmt="%d", delimiter=",", header="x,y,z", comments="")
+        f_names.append(f_name)
+    return f_names
+
+def measure(func, repeat=3):
+    """
+    Measures the best wall time and the peak memory of given function
+    @param func   : Function without arguments
+    @param repeat : Number of timed runs
+    @return       : (best run time in seconds, peak memory allocated during one run in bytes)
+    """
+    t = timeit(func, repeat=repeat)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak
+
+def get_stages(recordings, f_names, tmp_dir, window, review_length):
+    """
+    Prepares the benchmarked stages for one synthetic dataset
+    @param recordings    : Array of shape (recordings, 3, samples) with integer acceleration readings
+    @param f_names       : Raw csv files of the first recordings
+    @param tmp_dir       : Directory for the processed files
+    @param window        : Moving average window width
+    @param review_length : Padding length
+    @return              : List of (stage name, function without arguments, number of processed items)
+    """
+    process_data = load_script("Process Data.py")
+    num = len(recordings)
+    smooth = movingAvgBatch(recordings, window=window)
+    flat = smooth.reshape(num, -1)
+    lengths = np.full(num, recordings.shape[-1])
+    # Processed files of the whole dataset
+    csv_name = os.path.join(tmp_dir, "Processed Data.csv")
+    with open(csv_name, "w") as csv_file:
+        for i, data in enumerate(flat):
+            csv_file.write("{},{}\n".format(",".join(map(str, data)), i % len(LABELS)))
+    npy_name = os.path.join(tmp_dir, "Processed Data.npy")
+    save_processed_arrays(npy_name, flat, np.arange(num) % len(LABELS))
+    padded = np.take_along_axis(smooth, pad_indexes(lengths, review_length, "start")[:, np.newaxis], axis=-1)
+    padded = padded.transpose(1, 0, 2)[:, :, np.newaxis, :]                     # Shape of the model input
+    augmenter = Augmenter(seed=0)
+    frames = [pd.DataFrame(recording.T, columns=("x", "y", "z")) for recording in recordings[:len(f_names)]]
+    return [("movingAvg", lambda: [movingAvg(axis, window) for recording in recordings for axis in recording], 3*num),
+            ("movingAvgBatch", lambda: movingAvgBatch(recordings, window=window), 3*num),
+            ("normalize", lambda: [normalize(data) for data in flat], num),
+            ("uniform_split", lambda: [uniform_split(data, parts=3) for data in flat], num),
+            ("pad_constant", lambda: [pad_constant(axis, review_length, pad_pos="start") for data in smooth for axis in data], 3*num),
+            ("pad_indexes", lambda: np.take_along_axis(smooth, pad_indexes(lengths, review_length, "start")[:, np.newaxis], axis=-1), 3*num),
+            ("resample_batch", lambda: resample_batch(smooth, review_length, lengths=lengths), 3*num),
+            ("load_raw_data", lambda: [load_raw_data(df, movingAvgWindow=window) for df in frames], len(frames)),
+            ("load_raw_batch", lambda: load_raw_batch(list(np.transpose(recordings, (0, 2, 1))), review_length, window), num),
+            ("load_processed_csv", lambda: train_test_mask(load_processed_csv(csv_name, review_length, "start")[1]), num),
+            ("load_processed_arrays", lambda: train_test_mask(load_processed_arrays(npy_name, review_length, "start")[1]), num),
+            ("BatchGenerator csv", lambda: sum(1 for _ in BatchGenerator(csv_name, review_length, "start").epoch()), num),
+            ("BatchGenerator npy", lambda: sum(1 for _ in BatchGenerator(npy_name, review_length, "start").epoch()), num),
+            ("Augmenter", lambda: augmenter(padded), num),
+            ("process_file", lambda: [process_data.process_file(f_name, window, True) for f_name in f_names], len(f_names))]
+
+def load_script(f_name):
+    """
+    Imports a script of the src directory whose name is not a valid module name, e.g. "Process Data.py"
+    """
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), f_name)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(f_name)[0].replace(" ", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def compare(results, baseline, tolerance):
+    """
+    Flags the stages that got slower or use more memory than in the baseline
+    @param results   : Benchmark results {"stage [recordings]": {"time": s, "peak_memory": bytes, ...}}
+    @param baseline  : Results of an earlier run
+    @param tolerance : Allowed relative increase, e.g. 0.25 for 25%
+    @return          : List of regressed stage names
+    """
+    regressions = []
+    print(" {:<36} {:>10} {:>10}".format("Comparison with baseline", "Time", "Memory"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        time_ratio = result["time"]/baseline[name]["time"]
+        memory_ratio = (result["peak_memory"]+1)/(baseline[name]["peak_memory"]+1)
+        regressed = time_ratio > 1+tolerance or memory_ratio > 1+tolerance
+        if regressed:
+            regressions.append(name)
+        print(" {:<36} {:>9.2f}x {:>9.2f}x {}".format(name, time_ratio, memory_ratio, "REGRESSION" if regressed else ""))
+    return regressions
+
+def main(scales, numSamples, window, maxFiles, repeat, check, saveFile, baselineFile, tolerance):
+    print(TITLE)
+    print(" Recordings: {}, Samples: {}, Moving Average Window: {}".format(scales, numSamples, window))
+    review_length = numSamples+25
+    if check:
+        recordings = np.random.randint(-2048, 2048, size=(20, 3, numSamples))
+        check_movingAvg(recordings, window)
+        print(" movingAvg: results match the reference loop")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            f_name = os.path.join(tmp_dir, "Processed Data.csv")
+            write_processed_csv(f_name, 50, numSamples)
+            check_load_processed(f_name, review_length)
+        print(" load_processed_csv: results match the reference loader")
+    results = {}
+    for num in scales:
+        print("\n {:<26} {:>12} {:>12} {:>16}".format("Stage [{}]".format(num), "Time (ms)", "Memory (MB)", "Throughput (/s)"))
+        recordings = np.random.randint(-2048, 2048, size=(num, 3, numSamples))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            f_names = write_raw_files(os.path.join(tmp_dir, "RAW_Data"), recordings[:maxFiles])
+            for name, func, items in get_stages(recordings, f_names, tmp_dir, window, review_length):
+                t, peak = measure(func, repeat=repeat)
+                results["{} [{}]".format(name, num)] = {"time": t, "peak_memory": peak, "throughput": items/t, "items": items}
+                print(" {:<26} {:>12.2f} {:>12.2f} {:>16.0f}".format(name, 1000*t, peak/2**20, items/t))
+    print()
+    if saveFile:
+        with open(saveFile, "w") as json_file:
+            json.dump({"samples": numSamples, "window": window, "max_files": maxFiles, "results": results}, json_file, indent=2)
+        print(" Results saved at: {}\n".format(saveFile))
+    if baselineFile:
+        with open(baselineFile, "r") as json_file:
+            baseline = json.load(json_file)["results"]
+        regressions = compare(results, baseline, tolerance)
+        print("\n {} regression(s) above {:.0f}%\n".format(len(regressions), 100*tolerance))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--recordings", help="Numbers of synthetic recordings; one dataset each", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("-s", "--samples", help="Number of samples per axis", type=int, default=125)
+    parser.add_argument("-w", "--width", help="Moving average window width", type=int, default=13)
+    parser.add_argument("-f", "--files", help="Maximum number of raw csv files written for the file based stages", type=int, default=1000)
+    parser.add_argument("-n", "--repeat", help="Number of timed runs of each stage", type=int, default=3)
+    parser.add_argument("-c", "--check", help="Check the vectorized functions against the reference loops", action="store_true")
+    parser.add_argument("--save", help="Save the results as JSON baseline", type=str, default="")
+    parser.add_argument("--compare", help="Compare the results with a JSON baseline", type=str, default="")
+    parser.add_argument("--tolerance", help="Allowed relative slowdown or memory increase", type=float, default=0.25)
+    args = parser.parse_args()
+    sys.exit(main(scales=args.recordings, numSamples=args.samples, window=args.width, maxFiles=args.files, repeat=args.repeat,
+                  check=args.check, saveFile=args.save, baselineFile=args.compare, tolerance=args.tolerance))
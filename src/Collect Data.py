@@ -1,5 +1,6 @@
 from microbit import display, Image, sleep, button_a, button_b, running_time, accelerometer
 from micropython import const
+from array import array
 # States
 GET_DATA_NUM    = const(0)
 READY_TO_SAMPLE = const(1)
@@ -11,6 +12,7 @@ MAX_FILES_NUM   = const(12)
 MAX_ATTEMPT     = const(3)
 SAMPLE_PERIOD   = const(10)                                                 # Sample period in ms
 SAMPLE_DURATION = const(1500)                                               # Total sample time in ms
+MAX_SAMPLES     = const(150)                                                # SAMPLE_DURATION/SAMPLE_PERIOD
 ACK             = const("0")
 NACK            = const("1")
 # LED Numbers; 3, 2, 1
@@ -85,14 +87,22 @@ def main():
         elif state == SAMPLE_DATA:
             countdown(1)
             display.show(Image.TARGET)
+            samples = array("h", (0 for i in range(3*MAX_SAMPLES)))              # x, y, z of each sample
+            times = array("H", (0 for i in range(MAX_SAMPLES)))                 # Sample time in ms since the first sample
+            n = 0
+            initial_time = next_time = running_time()
+            # Sample into RAM only; writing to the flash inside the loop delays the samples
+            while (running_time()-initial_time) < SAMPLE_DURATION and n < MAX_SAMPLES:
+                t0 = running_time()
+                samples[3*n], samples[3*n+1], samples[3*n+2] = accelerometer.get_values()
+                times[n] = t0-initial_time
+                n += 1
+                next_time += SAMPLE_PERIOD                                      # Fixed schedule; delays do not accumulate
+                wait_t = next_time-running_time()
+                sleep(wait_t if wait_t > 0 else 0)
             with open("file_{}.csv".format(data_sent), "w") as data_file:
-                data_file.write("x,y,z\n")
-                initial_time = running_time()
-                while (running_time()-initial_time) < SAMPLE_DURATION:
-                    t0 = running_time()
-                    data_file.write("{},{},{}\n".format(*accelerometer.get_values()))
-                    t_diff = running_time()-t0
-                    sleep(0 if (SAMPLE_PERIOD-t_diff)<0 else SAMPLE_PERIOD-t_diff)
+                data_file.write("x,y,z,t\n"+"".join("{},{},{},{}\n".format(samples[3*i], samples[3*i+1], samples[3*i+2], times[i])
+                                                    for i in range(n)))
             data_sent += 1
             if (data_num-data_sent)>0:
                 state = READY_TO_SAMPLE
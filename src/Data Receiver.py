@@ -6,17 +6,23 @@ from microbit import display, Image, sleep, button_a, button_b, running_time, ua
 
 # Global constants
 CHANNEL = const(25)
+FRAME_MAGIC = const(0xA5)								# First byte of binary frames (see Protocol.py)
 
 def main():
 	data_received = 0
 	display.show(Image.HAPPY)
 	while True:
-		response = radio.receive()
-		if response is not None:							# Some data received
-			uart.write(response+"\n")						# Write received data with line break on serial bus
+		msg = radio.receive_bytes()
+		if msg is not None:								# Some data received
+			if msg[0] == FRAME_MAGIC:						# Binary frame; self-delimiting, forwarded unchanged
+				uart.write(msg)
+				response = None
+			else:
+				response = str(msg[3:], "utf8")				# Text sent with radio.send(); without its 3 byte prefix
+				uart.write(response+"\n")					# Write received data with line break on serial bus
 			if data_received == 0:
 				display.clear()								# Clear Microbit LEDs
-			if "," in response:								# "(x,y,z)" data received
+			if response is None or "," in response:		# Binary frame or "(x,y,z)" data received
 				cy, cx = divmod(data_received, 5)
 				display.set_pixel(cx, cy, 9)
 				# Increase and limit data_received value within 0-24 range
@@ -29,13 +35,13 @@ def main():
 				sleep(2000)
 				display.clear()
 				break
-        else:
+		else:
 			sleep(100)
 
 if __name__ == "__main__":
 	try:
 		uart.init(baudrate=115200, bits=8, parity=None, stop=1)
-		radio.config(channel=CHANNEL, data_rate=radio.RATE_2MBIT, power=7, queue=150)
+		radio.config(channel=CHANNEL, data_rate=radio.RATE_2MBIT, power=7, queue=150, length=64)
 		radio.on()
 		main()
 	finally:
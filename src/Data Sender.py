@@ -1,5 +1,6 @@
 from microbit import display, Image, sleep, button_a, button_b, running_time, accelerometer
 from micropython import const
+import ustruct
 import radio
 # States
 READY           = const(1)
@@ -13,6 +14,13 @@ SAMPLE_INTERVAL = const(10)                                                 # Sa
 SAMPLE_DURATION = const(1500)                                               # Total sample time in ms
 ACK             = const(b"0")
 NACK            = const(b"1")
+# Binary frames (see Protocol.py): header "<BHIB" (magic, sequence number, timestamp in ms, sample count)
+# followed by "<Bhhh" (time offset in ms, x, y, z) per sample
+BINARY_MODE     = const(0)                                                  # 1 to send binary frames instead of "(x, y, z)" text
+FRAME_MAGIC     = const(0xA5)
+FRAME_SAMPLES   = const(4)                                                  # Samples per radio packet
+HEADER_SIZE     = const(8)
+SAMPLE_SIZE     = const(7)
 # LED Numbers (3,2,1) rotated 90 degrees clockwise
 NUM_IMGS = const([Image("90909:90909:90909:99999:99999"),
 				  Image("99909:90909:90909:90909:90999"),
@@ -88,8 +96,23 @@ def sendMsg(data, wait_time=1000, pooling_interval=10):
 	response = waitForACK(timer=wait_time, pooling_interval=pooling_interval)
 	return response
 
+def sendFrame(frame, sequence, timestamp, count):
+	"""
+	Fills the frame header and sends the frame
+	@param frame     : bytearray with count packed samples after the header
+	@param sequence  : Sequence number of the frame
+	@param timestamp : Time of the first sample in ms
+	@param count     : Number of samples in the frame
+	@returns         : Next sequence number
+	"""
+	ustruct.pack_into("<BHIB", frame, 0, FRAME_MAGIC, sequence, timestamp, count)
+	radio.send_bytes(frame[:HEADER_SIZE+count*SAMPLE_SIZE])
+	return (sequence+1) & 0xFFFF
+
 def main():
 	state = READY
+	sequence = 0																# Frame sequence number; continues over gestures
+	frame = bytearray(HEADER_SIZE+FRAME_SAMPLES*SAMPLE_SIZE)
 	while True:
 		# Ready state
 		if state == READY:
@@ -110,18 +133,31 @@ def main():
 			countdown(3)															# Show countdown on the Microbit LED	
 			display.show(Image.TARGET)
 			radio.on()
+			count = 0																# Samples in the current frame
 			initial_time = running_time()
 			while (running_time()-initial_time) < SAMPLE_DURATION:
 				t0 = running_time()
 				if data_sent == 0:													# Turn off all Microbit LEDs
 					display.clear()
 				cx, cy = divmod(data_sent, 5)										# Get current LED pixel coordinate of the BBC Microbit
-				radio.send(str(accelerometer.get_values()))
+				x, y, z = accelerometer.get_values()
+				if BINARY_MODE:
+					if count == 0:
+						frame_time = t0
+					ustruct.pack_into("<Bhhh", frame, HEADER_SIZE+count*SAMPLE_SIZE, t0-frame_time, x, y, z)
+					count += 1
+					if count == FRAME_SAMPLES:
+						sequence = sendFrame(frame, sequence, frame_time, count)
+						count = 0
+				else:
+					radio.send(str((x, y, z)))
 				display.set_pixel(4-cx, cy, 9)
 				data_sent = 0 if data_sent >= 24 else data_sent+1					# Increase and limit data_sent value within 0-24 range
 				wait_t = SAMPLE_INTERVAL-(running_time()-t0)						# Time till next sample
 				if (wait_t > 0):
 					sleep(wait_t)
+			if count:
+				sequence = sendFrame(frame, sequence, frame_time, count)			# Last incomplete frame
 			radio.send("done")
 			radio.off()
 			state = READY
@@ -133,7 +169,7 @@ def main():
 
 if __name__ == "__main__":
 	try:
-		radio.config(channel=CHANNEL, data_rate=radio.RATE_2MBIT, power=7, queue=20)
+		radio.config(channel=CHANNEL, data_rate=radio.RATE_2MBIT, power=7, queue=20, length=64)
 		main()
 	finally:
 		radio.off()
\ No newline at end of file
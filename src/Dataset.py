@@ -0,0 +1,225 @@
+import threading
+import numpy as np
+from queue import Queue, Full
+from Trace import span
+from Utils import parse_processed_rows, pad_indexes, meta_file_name, train_test_mask, LABELS
+
+class ProcessedFile(object):
+    """
+    Row access to a processed csv or array file without loading it; only the labels (and the row offsets of csv files)
+    are kept in memory
+    """
+    def __init__(self, f_name):
+        """
+        @param f_name : Processed csv file or processed array file (.npy)
+        """
+        self.f_name = f_name
+        self.binary = f_name.endswith(".npy")
+        if self.binary:
+            self.array = np.load(f_name, mmap_mode="r")                         # Shape: (recordings, 3, max length)
+            with np.load(meta_file_name(f_name)) as meta:
+                self.labels, self.lengths = meta["labels"].astype(np.int64), meta["lengths"]
+        else:
+            offsets, labels = [0], []
+            with open(f_name, "rb") as csv_file:
+                for row in csv_file:
+                    if row.strip():
+                        labels.append(int(float(row.rsplit(b",", 1)[-1])))      # Last value of each row is its label
+                        offsets.append(offsets[-1]+len(row))
+                    else:
+                        offsets[-1] += len(row)                                 # Empty line belongs to the next row
+            self.offsets = np.array(offsets, dtype=np.int64)                    # Start of each row and end of the last row
+            self.labels = np.array(labels, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def read(self, rows, review_length, pad_pos="end"):
+        """
+        Reads and pads the given rows
+        @param rows          : Sorted array of row indexes
+        @param review_length : Padding length of each axis
+        @param pad_pos       : "start" or "end"; padding position
+        @return              : (data, labels) where data has the shape (3, rows, 1, review_length)
+        """
+        rows = np.asarray(rows)
+        if self.binary:
+            indexes = pad_indexes(self.lengths[rows], review_length, pad_pos=pad_pos)
+            data = np.take_along_axis(self.array[rows], indexes[:, np.newaxis, :], axis=-1)
+            return data.transpose(1, 0, 2)[:, :, np.newaxis, :], self.labels[rows]
+        # One read from the first to the last row; rows in between that are not selected are skipped
+        with open(self.f_name, "rb") as csv_file:
+            csv_file.seek(self.offsets[rows[0]])
+            chunk = csv_file.read(self.offsets[rows[-1]+1]-self.offsets[rows[0]])
+        starts, ends = self.offsets[rows]-self.offsets[rows[0]], self.offsets[rows+1]-self.offsets[rows[0]]
+        lines = [chunk[start : end].strip().decode() for start, end in zip(starts, ends)]
+        data, _ = parse_processed_rows(lines, review_length, pad_pos=pad_pos)
+        return data, self.labels[rows]
+
+class BatchGenerator(object):
+    """
+    Endless generator of training batches that reads the processed file in chunks; for model.fit_generator with
+    steps_per_epoch=len(generator). Memory use depends on buffer_size, chunk_size and prefetch, not on the file size
+    """
+    def __init__(self, data_file, review_length, pad_pos="end", rows=None, batch_size=32, shuffle=True,
+                 buffer_size=1024, chunk_size=256, prefetch=4, augment=None, fused=False, seed=None):
+        """
+        @param data_file     : ProcessedFile or file name of a processed csv or array file
+        @param review_length : Padding length of each axis
+        @param pad_pos       : "start" or "end"; padding position
+        @param rows          : Indexes or boolean mask of the used recordings, e.g. from train_test_mask; None for all
+        @param batch_size    : Recordings per batch; the last batch of each epoch can be smaller
+        @param shuffle       : True to shuffle the chunk order and the recordings within the shuffle buffer each epoch
+        @param buffer_size   : Number of recordings shuffled together
+        @param chunk_size    : Number of consecutive file rows read at once
+        @param prefetch      : Number of batches prepared ahead on the background thread
+        @param augment       : Function applied to the data of each batch, e.g. Augment.Augmenter; runs on the background
+                               thread. None for the recordings as they are
+        @param fused         : True to yield one array of shape (batch, 3, review_length) for models from
+                               Models.fused_model instead of the [x, y, z] list
+        @param seed          : Seed of the shuffling
+        """
+        self.file = data_file if isinstance(data_file, ProcessedFile) else ProcessedFile(data_file)
+        self.review_length = review_length
+        self.pad_pos = pad_pos
+        rows = np.arange(len(self.file)) if rows is None else np.asarray(rows)
+        self.rows = np.flatnonzero(rows) if rows.dtype == bool else np.sort(rows)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_size = max(buffer_size, batch_size)
+        self.prefetch = prefetch
+        self.augment = augment
+        self.fused = fused
+        self.random = np.random.RandomState(seed)
+        # Chunks of rows close to each other in the file
+        self.chunks = [self.rows[start : start+chunk_size] for start in range(0, len(self.rows), chunk_size)]
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        """
+        Number of batches per epoch
+        """
+        return -(-len(self.rows)//self.batch_size)
+
+    @property
+    def labels(self):
+        """
+        Label indexes of the used recordings in file order
+        """
+        return self.file.labels[self.rows]
+
+    def _batch(self, data, labels, augment=False):
+        if augment and self.augment is not None:
+            with span("augment"):
+                data = self.augment(data).astype(data.dtype, copy=False)
+        inputs = data[:, :, 0].transpose(1, 0, 2) if self.fused else list(data)
+        return inputs, np.eye(len(LABELS), dtype=np.float32)[labels]
+
+    def sample(self, size):
+        """
+        Returns the first recordings in file order, e.g. for plots
+        @param size : Number of recordings
+        @return     : (data, one-hot labels) where data has the shape (3, size, 1, review_length)
+        """
+        data, labels = self.file.read(self.rows[:size], self.review_length, pad_pos=self.pad_pos)
+        return data, self._batch(data, labels)[1]
+
+    def epoch(self):
+        """
+        Generator of the batches of one epoch; runs on the calling thread
+        @return : Generator of ([x, y, z], one-hot labels) with x, y, z of shape (batch, 1, review_length); with fused
+                  an array of shape (batch, 3, review_length) instead of the list
+        """
+        order = self.random.permutation(len(self.chunks)) if self.shuffle else range(len(self.chunks))
+        buffer_data, buffer_labels, buffered = [], [], 0
+        for i, index in enumerate(order):
+            with span("read chunk"):
+                data, labels = self.file.read(self.chunks[index], self.review_length, pad_pos=self.pad_pos)
+            buffer_data.append(data)
+            buffer_labels.append(labels)
+            buffered += len(labels)
+            last = (i == len(order)-1)
+            if buffered < self.buffer_size and not last:
+                continue
+            data, labels = np.concatenate(buffer_data, axis=1), np.concatenate(buffer_labels)
+            if self.shuffle:
+                permutation = self.random.permutation(len(labels))
+                data, labels = data[:, permutation], labels[permutation]
+            # Complete batches leave the buffer; the rest is shuffled again with the next chunks
+            end = len(labels) if last else len(labels)-len(labels) % self.batch_size
+            for start in range(0, end, self.batch_size):
+                yield self._batch(data[:, start : min(start+self.batch_size, end)], labels[start : min(start+self.batch_size, end)],
+                                  augment=True)
+            buffer_data, buffer_labels, buffered = [data[:, end:]], [labels[end:]], len(labels)-end
+
+    def _put(self, item):
+        """
+        Queues item unless the generator is closed while the queue is full
+        @return : False if the generator was closed
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                for batch in self.epoch():
+                    if not self._put(batch):
+                        return
+        except Exception as ex:
+            self._put(ex)                                                       # Raised again by __next__
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._thread is None:
+            self._queue = Queue(maxsize=self.prefetch)
+            self._thread = threading.Thread(target=self._produce, name="Batch prefetch", daemon=True)
+            self._thread.start()
+        batch = self._queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def close(self):
+        """
+        Stops the background thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def train_test_generators(f_name, review_length, pad_pos="end", train_ratio=0.75, seed=None, batch_size=32, train_file=None,
+                          fused=False, **kwargs):
+    """
+    Streaming counterpart of load_processed_data; the split only needs the labels
+    @param f_name        : Processed csv file or processed array file (.npy)
+    @param review_length : Padding length of each axis
+    @param pad_pos       : "start" or "end"; padding position
+    @param train_ratio   : Percentage of total data to use for training
+    @param seed          : None to use the first recordings of each label for training, else seed to select them randomly
+    @param batch_size    : Recordings per batch
+    @param train_file    : Augmented training recordings from Augment.py (same train_ratio and seed); replaces the
+                           training split of f_name. None to train on the split itself
+    @param fused         : True to yield the stacked input of Models.fused_model from both generators
+    @param kwargs        : Further BatchGenerator arguments of the training generator
+    @return              : (training BatchGenerator, test BatchGenerator); the test batches are not shuffled
+    """
+    data_file = ProcessedFile(f_name)
+    train_mask = train_test_mask(data_file.labels, train_ratio=train_ratio, seed=seed)
+    if train_file:
+        train = BatchGenerator(train_file, review_length, pad_pos=pad_pos, batch_size=batch_size, fused=fused, seed=seed, **kwargs)
+    else:
+        train = BatchGenerator(data_file, review_length, pad_pos=pad_pos, rows=train_mask, batch_size=batch_size, fused=fused,
+                               seed=seed, **kwargs)
+    test = BatchGenerator(data_file, review_length, pad_pos=pad_pos, rows=~train_mask, batch_size=batch_size, shuffle=False,
+                          fused=fused)
+    return train, test
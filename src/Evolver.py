@@ -0,0 +1,469 @@
+import os.path
+import random
+import hashlib
+import numpy as np
+from functools import wraps, partial
+from datetime import datetime
+from multiprocessing import Pool
+from Utils import load_processed_data, LABELS
+
+# Processed data of the current process; loaded once by initWorker
+DATA = {}
+
+def setThreads(threads):
+    """
+    Installs a Keras session limited to given number of TensorFlow threads in the current process
+    @param threads : Number of intra- and inter-op threads
+    @return        : Nothing
+    """
+    import keras
+    import tensorflow as tf
+    config = tf.ConfigProto(intra_op_parallelism_threads=threads, inter_op_parallelism_threads=threads)
+    keras.backend.set_session(tf.Session(config=config))
+
+def initWorker(data_file, review_length=150, pad_pos="start", train_ratio=0.08, threads=None, stream=False, fused=False):
+    """
+    Loads the processed data into the current (worker) process
+    @param data_file     : Processed data file
+    @param review_length : Padding length of each axis
+    @param pad_pos       : "start" or "end"; padding position
+    @param train_ratio   : Percentage of total data to use for training
+    @param threads       : Number of TensorFlow threads per process; None for the TensorFlow default
+    @param stream        : True to read the data in batches (Dataset.BatchGenerator) instead of loading it
+    @param fused         : True to train models with one stacked input (Models.fused_model)
+    @return              : Nothing
+    """
+    for batches in (DATA.get("train_batches"), DATA.get("test_batches")):
+        if batches is not None:
+            batches.close()                                                     # Prefetch thread of an earlier call
+    DATA.clear()
+    if stream:
+        from Dataset import train_test_generators
+        DATA["train_batches"], DATA["test_batches"] = train_test_generators(
+            data_file, review_length=review_length, pad_pos=pad_pos, train_ratio=train_ratio, batch_size=10, fused=fused)
+    else:
+        DATA["train"], DATA["train_labels"], DATA["test"], DATA["test_labels"] = load_processed_data(
+            data_file, review_length=review_length, pad_pos=pad_pos, train_ratio=train_ratio)
+    DATA["review_length"] = review_length
+    DATA["threads"] = threads
+    if threads:
+        setThreads(threads)                                                     # Already for the first host
+    DATA["fused"] = fused
+
+def createModel(param, input_shape, output_size, name="Unknown", fused=False):
+    """
+    Creates the shared LSTM and Dense model of given parameters
+    @param param       : (LSTM units, Shared_Dense_1 units, Shared_Dense_2 units, Dense_1 units)
+    @param input_shape : Shape of each axis input
+    @param output_size : Number of labels
+    @param name        : Name of the model
+    @param fused       : True for one stacked input (Models.fused_model) instead of the x, y and z inputs
+    @return            : keras.models.Model
+    """
+    from Models import build_model
+    return build_model(input_shape[-1], output_size, fused=fused, lstm_units=param[0], shared_units=param[1:3],
+                       head_units=param[3:4], dropout=0.5, name=name)
+
+def testModel(model, epochs=8, batch_size=10, verbose=0):
+    """
+    Trains and tests given model with the processed data of the current process
+    @return : Test accuracy
+    """
+    model.compile(loss='categorical_crossentropy', optimizer="adam", metrics=['accuracy'])
+    if "train_batches" in DATA:
+        train, test = DATA["train_batches"], DATA["test_batches"]
+        model.fit_generator(train, steps_per_epoch=len(train), epochs=epochs, verbose=verbose, workers=0)
+        scores = model.evaluate_generator(test, steps=len(test), workers=0)
+        return scores[1]
+    from Models import model_inputs
+    model.fit(x=model_inputs(model, DATA["train"]), y=DATA["train_labels"], epochs=epochs, batch_size=batch_size, verbose=verbose)
+    scores = model.evaluate(x=model_inputs(model, DATA["test"]), y=DATA["test_labels"], batch_size=batch_size, verbose=verbose)
+    return scores[1]
+
+def evaluateHost(param, epochs=5):
+    """
+    Fitness of a host; runs in the worker processes
+    @param param  : Host parameters
+    @param epochs : Training epochs
+    @return       : Test accuracy
+    """
+    import keras
+    model = createModel(param, (1, DATA["review_length"]), len(LABELS), fused=DATA["fused"])
+    fitness = testModel(model, epochs=epochs)
+    keras.backend.clear_session()
+    if DATA["threads"]:
+        setThreads(DATA["threads"])                                             # clear_session drops the limited session
+    return fitness
+
+def str2host(string):
+    """
+    Parses a "param_1,param_2,...=score[@epochs]" line of the log files; lines without epochs (older logs and
+    parameter files) have scores of unknown budget
+    @return : (parameter list, score, training epochs of the score or None)
+    """
+    string = string.rstrip("\n")
+    param, score = string.split("=")
+    score, _, epochs = score.partition("@")
+    return (list(map(int, param.split(","))), float(score), int(epochs) if epochs else None)
+
+def str2param(string):
+    """
+    Parses a "param_1,param_2,...=score[@epochs]" line of the log files
+    @return : (parameter list, score)
+    """
+    return str2host(string)[:2]
+
+def settingsDigest(data_file, *settings):
+    """
+    Short digest of a data file (path, size and modification time) and the training settings; names the fitness cache
+    of one configuration
+    """
+    stat = os.stat(data_file) if os.path.exists(data_file) else None
+    data = (os.path.abspath(data_file), stat.st_size if stat else None, stat.st_mtime if stat else None)
+    return hashlib.sha1(repr(data+settings).encode()).hexdigest()[:10]
+
+def meanScore(scores):
+    """
+    @return : Mean of given scores; 0 if there is none
+    """
+    return sum(scores)/len(scores) if scores else 0.0
+
+class FitnessCache(object):
+    """
+    Scores of already tested parameters with their training epochs; new scores are appended to a file in the log file format
+    """
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self.scores = {}                                                        # Parameters -> (score, epochs)
+        if file_name and os.path.exists(file_name):
+            with open(file_name, "r") as file:
+                for line in file:
+                    if "=" in line:
+                        param, score, epochs = str2host(line)
+                        if epochs is not None:                                  # Scores of unknown budget are not reused
+                            self.scores[tuple(param)] = (score, epochs)
+
+    def __contains__(self, param):
+        return tuple(map(int, param)) in self.scores
+
+    def __len__(self):
+        return len(self.scores)
+
+    def get(self, param):
+        return self.scores[tuple(map(int, param))][0]
+
+    def epochs(self, param):
+        """
+        Training epochs of the cached score of param
+        """
+        return self.scores[tuple(map(int, param))][1]
+
+    def add(self, param, score, epochs, save=True):
+        key = tuple(map(int, param))
+        self.scores[key] = (score, epochs)
+        if save and self.file_name:
+            with open(self.file_name, "a") as file:
+                file.write("{}={}@{}\n".format(",".join(map(str, key)), score, epochs))
+
+class Host(object):
+    def __init__(self, _param=None, _score=0, _epochs=None):
+        self.param = _param
+        self.score = _score
+        self.epochs = _epochs                                                   # Training epochs of the score; None if unknown
+
+    @property
+    def param_str(self):
+        return ",".join(map(str, self.param))
+
+    @param_str.setter
+    def param_str(self, value):
+        print("Permission denied!")
+
+class Evolver(object):
+    def __init__(self, data_file, review_length=150, pad_pos="start", train_ratio=0.08, epochs=5, rungs=None, eta=2,
+                 jobs=1, threads=None, cache_file="Fitness Cache.txt", mask="111111", decay_rate=0.022, mutate_prob=0.8,
+                 log_file=None, stream=False, fused=False):
+        """
+        @param data_file     : Processed data file used to train and test the hosts
+        @param review_length : Padding length of each axis
+        @param pad_pos       : "start" or "end"; padding position
+        @param train_ratio   : Percentage of total data to use for training
+        @param epochs        : Training epochs of each host
+        @param rungs         : Increasing training epochs for successive halving, e.g. (1, 2, 5); the last rung is the
+                               full budget. None to train every host with the given epochs
+        @param eta           : Only the best 1/eta of the hosts of a rung are promoted to the next rung
+        @param jobs          : Number of worker processes training hosts concurrently
+        @param threads       : Number of TensorFlow threads per worker; None for the TensorFlow default
+        @param cache_file    : Fitness cache file in the log directory; the digest of the data file and the training
+                               settings is added to its name, so other settings never reuse its scores. None to
+                               disable the persistent cache
+        @param stream        : True to train on batches read from the data file (constant memory) instead of loading it
+        @param fused         : True to train the hosts as fused models (Models.fused_model); same fitness, fewer layer calls
+        """
+        self.mask = mask
+        self.decay_rate = decay_rate             # 0.022
+        self.decay = self.getDecay(t=0)
+        self.mutate_prob = mutate_prob
+        self.hosts = []
+        self.scores = []
+        self.host_num = 0
+        self.generation = 0
+        self.rungs = tuple(rungs) if rungs else (epochs,)
+        self.epochs = self.rungs[-1]
+        self.eta = eta
+        self.jobs = jobs
+        self.data_args = (data_file, review_length, pad_pos, train_ratio, threads, stream, fused)
+        self.review_length = review_length
+        self.pool = None
+        self.log_dir = "Log"
+        self.log_file = log_file or "Log {date}.txt".format(date=datetime.now().strftime("%d.%m.%Y %H.%M"))
+        if not os.path.exists(self.log_dir):
+            print("- Creating log directory {}".format(self.log_dir))
+            os.mkdir(self.log_dir)
+        if cache_file:
+            digest = settingsDigest(data_file, review_length, pad_pos, train_ratio, self.rungs, mask, fused)
+            base, extension = os.path.splitext(cache_file)
+            cache_file = "{} {}{}".format(base, digest, extension)
+        self.cache = FitnessCache(os.path.join(self.log_dir, cache_file) if cache_file else None)
+
+    def generateModels(self, num_of_models=10, param=None, file_name=None):
+        self.hosts.clear()
+        if param:
+            if type(param) in (list, tuple):
+                print("Generating model from parameters!")
+                self.hosts += [Host(p, 0) for p in param]
+            else:
+                print("x Invalid param type received; {}".format(type(param)))
+        elif file_name:
+            print("Generating model from a file!")
+            self.loadParameters(file_name)
+        else:
+            print("Generating random models!")
+            for i in range(num_of_models):
+                param = np.random.randint(low=1, high=256, size=4)
+                #param = [random.randint(1+i*10, 10+(i+2)*10) for i in range(4, 0, -1)]
+                self.hosts.append(Host(param, 0))
+        self.host_num = len(self.hosts)
+
+    def loadParameters(self, file_name):
+        with open(file_name, "r") as file:
+            self.hosts.clear()
+            for param in file:
+                _param, _score, _epochs = str2host(param)
+                self.hosts.append(Host(_param, _score, _epochs))
+        print("Parameters loaded from {}!".format(file_name))
+
+    def resume(self, num_of_models, log_file=None):
+        """
+        Continues a run from its appended log file; each generation appended num_of_models lines
+        @param num_of_models : Number of hosts of the run
+        @param log_file      : Log file name in the log directory; None for the log file of this Evolver
+        @return              : Number of completed generations
+        """
+        self.log_file = log_file or self.log_file
+        with open(os.path.join(self.log_dir, self.log_file), "r") as file:
+            lines = [str2host(line) for line in file if "=" in line]
+        self.generation = len(lines)//num_of_models
+        assert self.generation > 0, "No complete generation in {}".format(self.log_file)
+        generations = [lines[g*num_of_models : (g+1)*num_of_models] for g in range(self.generation)]
+        self.scores = [meanScore([score for _, score, epochs in hosts if epochs == self.epochs])
+                       for hosts in generations]
+        for param, score, epochs in lines:
+            if epochs == self.epochs:                                           # Hosts cut at a lower rung are trained again
+                self.cache.add(param, score, epochs, save=False)
+        self.hosts = [Host(param, score, epochs) for param, score, epochs in generations[-1]]
+        self.host_num = num_of_models
+        self.decay = self.getDecay(self.generation-1)
+        print("Resumed {} generations from {}!".format(self.generation, self.log_file))
+        return self.generation
+
+    def saveParameters(self, file_name, file_mode="w"):
+        with open(os.path.join(self.log_dir, file_name), file_mode) as out_file:
+            for host in self.hosts:
+                # Each score keeps its training epochs, so resume only reuses full budget scores
+                epochs = "" if host.epochs is None else "@{}".format(host.epochs)
+                out_file.write("{}={}{}\n".format(host.param_str, host.score, epochs))
+        print("Parameters saved at {}!".format(file_name))
+
+    def evaluate(self, params, epochs=None):
+        """
+        Trains and tests hosts of given parameters; concurrently if jobs > 1
+        @param params : List of host parameters
+        @param epochs : Training epochs; None for the epochs of this Evolver
+        @return       : Iterator of scores in the order of params
+        """
+        evaluate = partial(evaluateHost, epochs=epochs or self.epochs)
+        if self.jobs > 1:
+            if self.pool is None:
+                self.pool = Pool(self.jobs, initializer=initWorker, initargs=self.data_args)
+            return self.pool.imap(evaluate, params)
+        if not DATA:
+            initWorker(*self.data_args)
+        return map(evaluate, params)
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def successiveHalving(self, params):
+        """
+        Trains all params for the first rung epochs and promotes the best 1/eta of them to each next rung
+        @param params : List of host parameters
+        @return       : (scores, epochs) lists in the order of params; epochs of the rung each score comes from
+        """
+        scores, epochs = [0]*len(params), [0]*len(params)
+        candidates = list(range(len(params)))
+        spent = 0                                                               # Total training epochs
+        for rung, rung_epochs in enumerate(self.rungs):
+            if rung > 0:
+                promoted = max(1, int(np.ceil(len(candidates)/self.eta)))
+                candidates = sorted(candidates, key=lambda i: scores[i], reverse=True)[:promoted]
+            results = self.evaluate([params[i] for i in candidates], epochs=rung_epochs)
+            spent += rung_epochs*len(candidates)
+            for n, (i, fitness) in enumerate(zip(candidates, results)):
+                print("@ Training progress (rung {}, {} epochs): {:>5.1f}%".format(
+                    rung+1, rung_epochs, 100*(n+1)/len(candidates)), end="\r")
+                scores[i], epochs[i] = fitness, rung_epochs
+            if candidates:
+                print()
+        if len(self.rungs) > 1 and params:
+            print("@ Training budget: {} of {} epochs ({:.1f}%)".format(spent, self.epochs*len(params), 100*spent/(self.epochs*len(params))))
+        return scores, epochs
+
+    def runTest(self):
+        pending = {}                                                            # Untested parameters and their hosts
+        for host in self.hosts:
+            if host.score == 0:
+                if host.param in self.cache and self.cache.epochs(host.param) == self.epochs:
+                    host.score, host.epochs = self.cache.get(host.param), self.epochs
+                else:
+                    pending.setdefault(tuple(map(int, host.param)), []).append(host)
+        params = list(pending)
+        print("@ Scored hosts: {}, Training hosts: {}".format(self.host_num-sum(map(len, pending.values())), len(params)))
+        scores, epochs = self.successiveHalving(params)
+        for param, fitness, _epochs in zip(params, scores, epochs):
+            if _epochs == self.epochs:
+                self.cache.add(param, fitness, _epochs)                         # Only full budget scores are reused
+            for host in pending[param]:
+                host.score, host.epochs = fitness, _epochs
+        self.sortFitness()
+        self.saveParameters(self.log_file, "a")
+        self.scores.append(self.averageScore(self.host_num))
+        self.generation += 1
+
+    def run(self, generations):
+        """
+        Runs the generations until the given total number of generations is reached
+        @param generations : Total number of generations, including already completed (resumed) ones
+        @return            : Nothing
+        """
+        try:
+            while self.generation < generations:
+                if self.generation > 0:
+                    self.evolve(self.generation-1)
+                print("# Generation", self.generation)
+                self.runTest()
+                self.printHosts()
+                print()
+        finally:
+            self.close()
+
+    def evolve(self, t):
+        evolve_num = int(self.host_num/2)
+        new_hosts = []
+        print("\n- Evolving the hosts")
+        print("  - Removing half of the weaker hosts")
+        del self.hosts[-evolve_num:]
+        print("  - Crossovering top 2 hosts")
+        crossover_param = self.crossover(self.hosts[0].param.copy(), self.hosts[1].param.copy(), 4)
+        for param in crossover_param:
+            new_hosts.append(Host(param, 0))
+        print("  - Mutating remaining top hosts")
+        mutation_num = evolve_num - len(crossover_param)
+        self.decay = self.getDecay(t)
+        for _ in range(mutation_num):
+            param = random.choice(self.hosts).param.copy()
+            mutated_param = self.mutate(param)
+            new_hosts.append(Host(mutated_param, 0))
+        print("  - Adding hosts")
+        print("    {}".format(", ".join("[{}]".format(host.param_str) for host in new_hosts)))
+        self.hosts += new_hosts
+        new_hosts.clear()
+
+    def sortFitness(self):
+        # Hosts eliminated at a lower rung (or of unknown budget) rank below the hosts trained with the full budget
+        fidelity = lambda host: 0 if host.epochs is None else min(host.epochs, self.epochs)
+        self.hosts = sorted(self.hosts, key=lambda host: (fidelity(host), host.score), reverse=True)
+
+    def _maskHost(self, host, mask):
+        return [value for value, mask_bit in zip(host, mask) if mask_bit == "1"]
+
+    def masking(*host_indexs):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(self, *args, **kwargs):
+                mask = kwargs.get("mask", self.mask)
+                if args:
+                    args = list(args)
+                for i in host_indexs:
+                    args[i] = self._maskHost(args[i], mask)
+                result = func(self, *args, **kwargs)
+                return result
+            return wrapper
+        return decorator
+
+    def crossover(self, paramA, paramB, max_crossover=None, mask=None):
+        assert len(paramA) == len(paramB), "Host A and B are not of same length; {} and {}".format(len(paramA), len(paramB))
+        HOST_LEN = len(paramA)
+        max_crossover = max_crossover or HOST_LEN
+        assert 0 <= max_crossover <= HOST_LEN, "Maximum cross number greater than crossable host length"
+
+        cross_index = {random.randint(0, HOST_LEN-1) for _ in range(max_crossover)}
+        cross_index_A = list(cross_index.copy())
+        cross_index_B = list(cross_index.copy())
+        del cross_index
+        random.shuffle(cross_index_B)
+
+        print("    {} & {}".format(paramA, paramB), end=" >> ")
+        print(cross_index_A, cross_index_B, sep=" & ", end=" >> ")
+        for i, j in zip(cross_index_A, cross_index_B):
+            paramA[i], paramB[j] = paramB[j], paramA[i]
+        print("{} & {}".format(paramA, paramB))
+        return paramA, paramB
+
+    def getDecay(self, t=0):
+        e = 2.718
+        return e**(-self.decay_rate*t)
+
+    def mutate(self, param, mask=None):
+        PARAM_LEN = len(param)
+        print("   ", param, end=" >> ")
+        mutate_prob = self.mutate_prob*self.decay
+        mutate_limit = max(1, round(20*self.decay))
+        for i in range(PARAM_LEN):
+            if random.random() <= mutate_prob:
+                rand_value = random.randint(-mutate_limit, mutate_limit)
+                param[i] = max(8, param[i] + rand_value)
+                del rand_value
+        print(param)
+        return param
+
+    def printHosts(self):
+        print("\n# All hosts")
+        for i in range(self.host_num):
+            print(" {:>2}) {}: {:.5f}".format(i+1, self.hosts[i].param, self.hosts[i].score), end="\t\t")
+            if not (i+1)%2:
+                print()
+        print("- Average score: {:.5f}".format(self.scores[-1]))
+
+    def averageScore(self, num=3):
+        """
+        Mean score of the full budget hosts among the first num hosts; scores cut at a lower rung are left out
+        """
+        assert 0 < num <= self.host_num, "Given number out of range!"
+        return meanScore([host.score for host in self.hosts[:num] if host.epochs == self.epochs])
@@ -0,0 +1,137 @@
+import os
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import Trace
+from Utils import movingAvgBatch, resample_batch, axis_stats, getFileNames
+
+TITLE = ("\n\t\t\t\t\t#################"
+         "\n\t\t\t\t\t# Feature Store #"
+         "\n\t\t\t\t\t#################\n")
+
+def file_digest(f_name, chunk_size=65536):
+    """
+    Returns the SHA-1 digest of the content of given file
+    @param f_name     : File name
+    @param chunk_size : Number of bytes read at once
+    @return           : Hexadecimal digest string
+    """
+    sha1 = hashlib.sha1()
+    with open(f_name, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+class FeatureStore(object):
+    """
+    Per-recording cache of the processing stages, each keyed by what it depends on:
+        raw    - x, y, z (and t) columns of the csv file; by file content
+        smooth - Smoothed (and resampled) axes with their min, max, mean and std; by file content, window and resampling
+    Normalization is computed from the stored statistics and not cached, so changing it reads no csv file and
+    changing the window only repeats the smoothing
+    """
+    def __init__(self, directory="Cache"):
+        """
+        @param directory : Directory of the stage files; shared with parallel workers
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, "{}.npz".format(key))
+
+    def _save(self, key, **arrays):
+        path = self._path(key)
+        tmp_path = "{}.{}.tmp.npz".format(path[:-4], os.getpid())
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)                                              # Atomic rename; parallel workers never see partial files
+
+    def raw(self, f_name, digest=None):
+        """
+        @param f_name : Raw csv file name
+        @param digest : file_digest of f_name if already known
+        @return       : (integer array of shape (3, samples), sample times or None for files without "t" column)
+        """
+        key = "{} raw".format(digest or file_digest(f_name))
+        path = self._path(key)
+        if os.path.exists(path):
+            Trace.count("raw hits")
+            with Trace.span("cache read"), np.load(path) as stage:
+                return stage["data"], (stage["times"] if "times" in stage else None)
+        with Trace.span("read csv"):
+            df = pd.read_csv(f_name)                                            # Load given csv file as pandas.DataFrame
+            df.columns = pd.Index(i.strip() for i in df.columns)                # Strip redundant spaces from column names
+        data = np.array([df[col] for col in ("x", "y", "z")])
+        times = np.asarray(df["t"]) if ("t" in df) else None
+        with Trace.span("cache write"):
+            self._save(key, data=data, **({} if times is None else {"times": times}))
+        return data, times
+
+    def smoothed(self, f_name, window, length=None, rate=None):
+        """
+        Same values as load_raw_data without normalization, together with their statistics
+        @param f_name : Raw csv file name
+        @param window : Window width for the moving average
+        @param length : Number of samples per axis after resampling; None to keep the samples
+        @param rate   : Sample rate (in Hz) of the resampling; None to stretch each recording to length samples
+        @return       : (array of shape (3, samples), axis_stats dictionary of arrays of shape (3,))
+        """
+        with Trace.span("digest"):
+            digest = file_digest(f_name)
+        key = "{} w{}".format(digest, window)
+        if length:
+            key += " r{} {}".format(length, rate or 0)
+        path = self._path(key)
+        if os.path.exists(path):
+            Trace.count("smooth hits")
+            with Trace.span("cache read"), np.load(path) as stage:
+                return stage["data"], {name: stage[name] for name in ("min", "max", "mean", "std")}
+        data, times = self.raw(f_name, digest=digest)
+        with Trace.span("smooth"):
+            data = movingAvgBatch(data, window=window)
+        if length:
+            with Trace.span("resample"):
+                data = resample_batch(data[np.newaxis], length, times=None if times is None else times[np.newaxis], rate=rate)[0]
+        stats = axis_stats(data)
+        with Trace.span("cache write"):
+            self._save(key, data=data, **stats)
+        return data, stats
+
+    def statistics(self, f_names, window, length=None, rate=None):
+        """
+        Statistics of many recordings, e.g. to compare normalization modes
+        @return : Dictionary "min", "max", "mean", "std" -> array of shape (recordings, 3)
+        """
+        stats = [self.smoothed(f_name, window, length=length, rate=rate)[1] for f_name in f_names]
+        return {name: np.array([_stats[name] for _stats in stats]) for name in ("min", "max", "mean", "std")}
+
+def main(dataDir, cacheDir, window, length, rate):
+    print(TITLE)
+    rootDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))      # Main directory of the project
+    # Same directories as "Process Data.py" for the same arguments, so both share the cache
+    dataDir = os.path.join(rootDir, dataDir)
+    if not os.path.exists(dataDir):
+        raise OSError("Invalid directory: {}".format(dataDir))
+    cacheDir = os.path.join(rootDir, cacheDir)
+    print(" Data directory: {}".format(dataDir))
+    print(" Cache directory: {}".format(cacheDir))
+    f_names = getFileNames(dataDir)
+    stats = FeatureStore(cacheDir).statistics(f_names, window, length=length, rate=rate)
+    print(" Recordings: {}, Moving Average Window: {}".format(len(f_names), window))
+    print(" {:<5} {:>10} {:>10} {:>10} {:>10} {:>12}".format("Axis", "Min", "Max", "Mean", "Std", "Mean range"))
+    for axis, name in enumerate("xyz"):
+        print(" {:<5} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.1f}".format(
+            name, stats["min"][:, axis].min(), stats["max"][:, axis].max(), stats["mean"][:, axis].mean(),
+            stats["std"][:, axis].mean(), (stats["max"][:, axis]-stats["min"][:, axis]).mean()))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data", help="Directory with raw data", type=str, default="RAW_Data")
+    parser.add_argument("-c", "--cache", help="Directory of the feature store", type=str, default="Cache")
+    parser.add_argument("-w", "--width", help="Moving average window width", type=int, default=13)
+    parser.add_argument("-r", "--resample", help="Resample every recording to given samples per axis; 0 to keep the samples", type=int, default=0)
+    parser.add_argument("--rate", help="Sample rate (in Hz) of the resampling; 0 to stretch each recording", type=float, default=0)
+    args = parser.parse_args()
+    main(dataDir=args.data, cacheDir=args.cache, window=args.width, length=args.resample or None, rate=args.rate or None)
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+from Utils import getLabel, LABELS
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS files (
+                path    TEXT PRIMARY KEY,       -- Relative to the data directory
+                session TEXT NOT NULL,          -- Session directory, e.g. "Down 05 01 2019 15-56"
+                label   INTEGER NOT NULL,       -- Index of LABELS; -1 for unknown
+                mtime   REAL NOT NULL,
+                size    INTEGER NOT NULL,
+                rows    INTEGER NOT NULL        -- Number of samples
+            )"""
+
+def countRows(f_name, chunk_size=65536):
+    """
+    Returns the number of data rows of a csv file with header
+    @param f_name     : File name
+    @param chunk_size : Number of bytes read at once
+    @return           : Number of lines after the header
+    """
+    lines, last = 0, b"\n"
+    with open(f_name, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1                                                              # Last line without line break
+    return max(lines-1, 0)
+
+def scanFiles(dataDir, extension=".csv"):
+    """
+    Yields os.DirEntry of all files of given format in the directory tree
+    @param dataDir   : Root directory path to search for files
+    @param extension : Extension of the file format
+    @return          : Generator of os.DirEntry
+    """
+    with os.scandir(dataDir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                yield from scanFiles(entry.path, extension=extension)
+            elif entry.name.endswith(extension):
+                yield entry
+
+class Manifest(object):
+    """
+    Persistent index of the raw data files; updated incrementally from their modification time and size
+    """
+    def __init__(self, dataDir, db_file=None):
+        """
+        @param dataDir : Directory with raw data
+        @param db_file : SQLite file of the index; default "Manifest.db" next to the data directory
+        """
+        self.dataDir = os.path.abspath(dataDir)
+        self.db_file = db_file or os.path.join(os.path.dirname(self.dataDir), "Manifest.db")
+        self.connection = sqlite3.connect(self.db_file)
+        self.connection.execute(SCHEMA)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def update(self):
+        """
+        Adds new and changed files and removes deleted files from the index
+        @return : (number of added or changed files, number of removed files)
+        """
+        known = {path: (mtime, size) for path, mtime, size in self.connection.execute("SELECT path, mtime, size FROM files")}
+        changed = []
+        for entry in scanFiles(self.dataDir):
+            path = os.path.relpath(entry.path, self.dataDir)
+            stat = entry.stat()
+            if known.pop(path, None) != (stat.st_mtime, stat.st_size):
+                session = os.path.dirname(path)
+                changed.append((path, session, getLabel(path), stat.st_mtime, stat.st_size, countRows(entry.path)))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", changed)
+            self.connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in known))
+        return len(changed), len(known)
+
+    def select(self, labels=None, sessions=None, min_rows=0):
+        """
+        Returns the files matching all given conditions
+        @param labels   : List of label names or indexes; None for all labels
+        @param sessions : List of session directory names; None for all sessions
+        @param min_rows : Minimum number of samples
+        @return         : List of file names (with data directory address), sorted by path
+        """
+        query, args = "SELECT path FROM files WHERE rows >= ?", [min_rows]
+        if labels is not None:
+            labels = [LABELS.index(label.lower()) if isinstance(label, str) else label for label in labels]
+            query += " AND label IN ({})".format(",".join("?"*len(labels)))
+            args += labels
+        if sessions is not None:
+            query += " AND session IN ({})".format(",".join("?"*len(sessions)))
+            args += list(sessions)
+        rows = self.connection.execute(query+" ORDER BY path", args)
+        return [os.path.join(self.dataDir, path) for path, in rows]
+
+    def summary(self):
+        """
+        Returns the number of files and samples of each label
+        @return : Dictionary label name -> (files, samples)
+        """
+        rows = self.connection.execute("SELECT label, COUNT(*), SUM(rows) FROM files GROUP BY label ORDER BY label")
+        return {(LABELS[label] if 0 <= label < len(LABELS) else "unknown"): (files, samples) for label, files, samples in rows}
@@ -0,0 +1,183 @@
+import argparse
+import numpy as np
+from time import perf_counter
+from Utils import execute_layers, load_processed_data, LABELS
+
+TITLE = ("\n\t\t\t\t\t##########"
+         "\n\t\t\t\t\t# Models #"
+         "\n\t\t\t\t\t##########\n")
+
+def branch_model(review_length, output_size, lstm_units=150, shared_units=(960, 960, 320), head_units=(39,), dropout=0.75,
+                 name="Branch"):
+    """
+    Creates the model of "Train Gesture Reader.ipynb": the shared LSTM and Dense layers are applied to the x, y and z
+    inputs one after another and their outputs are concatenated
+    @param review_length : Input length of each axis
+    @param output_size   : Number of labels
+    @param lstm_units    : Units of the shared LSTM layer
+    @param shared_units  : Units of the shared Dense layers
+    @param head_units    : Units of the Dense layers after the concatenation; followed by the classification layer
+    @param dropout       : Input dropout of the LSTM layer
+    @param name          : Name of the model
+    @return              : keras.models.Model with the inputs [x, y, z] of shape (batch, 1, review_length)
+    """
+    import keras
+    from keras.models import Model
+    from keras.layers import Dense, Input, LSTM
+    inputs = [Input(shape=(1, review_length), name="Acceleration_{}".format(axis)) for axis in "xyz"]
+    shared_layers = [LSTM(lstm_units, activation="tanh", name="Shared_LSTM", dropout=dropout)]
+    shared_layers += [Dense(units, activation="relu", name="Shared_Dense_{}".format(i+1)) for i, units in enumerate(shared_units)]
+    output = keras.layers.concatenate(execute_layers(inputs=inputs, layers=shared_layers), name="Concatenate")
+    for i, units in enumerate(head_units):
+        output = Dense(units, activation="relu", name="Dense_{}".format(i+1))(output)
+    output = Dense(output_size, activation="softmax", name="Classification_Layer")(output)
+    return Model(inputs=inputs, outputs=output, name=name)
+
+def fused_model(review_length, output_size, lstm_units=150, shared_units=(960, 960, 320), head_units=(39,), dropout=0.75,
+                name="Fused"):
+    """
+    Same layers and weights as branch_model, but the axes are stacked into one input of shape (3, review_length) and
+    pass each shared layer once as a batch of 3*batch recordings; Flatten replaces the concatenation
+    @param               : See branch_model
+    @return              : keras.models.Model with one input of shape (batch, 3, review_length), see fuse_inputs
+    """
+    from keras.models import Model
+    from keras.layers import Dense, Input, LSTM, Reshape, TimeDistributed, Flatten
+    _input = Input(shape=(3, review_length), name="Acceleration")
+    output = Reshape((3, 1, review_length), name="Axes")(_input)
+    # TimeDistributed folds the axes into the batch dimension, so the LSTM runs once on (3*batch, 1, review_length)
+    output = TimeDistributed(LSTM(lstm_units, activation="tanh", dropout=dropout), name="Shared_LSTM")(output)
+    for i, units in enumerate(shared_units):
+        output = Dense(units, activation="relu", name="Shared_Dense_{}".format(i+1))(output)   # Applied to each axis
+    output = Flatten(name="Concatenate")(output)                                # x, y and z outputs one after another
+    for i, units in enumerate(head_units):
+        output = Dense(units, activation="relu", name="Dense_{}".format(i+1))(output)
+    output = Dense(output_size, activation="softmax", name="Classification_Layer")(output)
+    return Model(inputs=_input, outputs=output, name=name)
+
+def build_model(review_length, output_size, fused=False, **kwargs):
+    """
+    @param fused  : True for fused_model, False for branch_model
+    @param kwargs : Further arguments of the model function
+    @return       : keras.models.Model
+    """
+    return (fused_model if fused else branch_model)(review_length, output_size, **kwargs)
+
+def is_fused(model):
+    """
+    True for models with one stacked input like fused_model
+    """
+    return len(model.inputs) == 1
+
+def fuse_inputs(inputs):
+    """
+    Stacks the x, y and z inputs of branch models into the input of fused models
+    @param inputs : List of 3 arrays of shape (batch, 1, review_length) or array of shape (3, batch, 1, review_length)
+    @return       : Array of shape (batch, 3, review_length)
+    """
+    return np.asarray(inputs)[:, :, 0].transpose(1, 0, 2)
+
+def model_inputs(model, inputs):
+    """
+    Converts [x, y, z] inputs to the input format of the given model
+    """
+    return fuse_inputs(inputs) if is_fused(model) else list(inputs)
+
+def predict_function(model):
+    """
+    Returns a function mapping a list of 3 arrays of shape (batch, 1, review_length) to label probabilities for both
+    model types, e.g. for GestureRecognizer and MicroBatcher
+    """
+    if is_fused(model):
+        return lambda inputs: model.predict(fuse_inputs(inputs))
+    return model.predict
+
+def copy_weights(source, target):
+    """
+    Copies the weights of all layers with the same name, e.g. from a branch model into a fused model
+    @return : Names of the copied layers
+    """
+    copied = []
+    layers = {layer.name: layer for layer in target.layers}
+    for layer in source.layers:
+        weights = layer.get_weights()
+        if weights and layer.name in layers:
+            layers[layer.name].set_weights(weights)
+            copied.append(layer.name)
+    return copied
+
+def compare_models(models, data_train, labels_train, data_test, labels_test, epochs=10, batch_size=10, repeat=50):
+    """
+    Trains and tests each model on the same data
+    @param models     : Dictionary name -> compiled keras model
+    @param data_train : Array of shape (3, recordings, 1, review_length)
+    @param data_test  : Array of shape (3, recordings, 1, review_length)
+    @param repeat     : Number of timed single recording predictions
+    @return           : Dictionary name -> {"accuracy", "train_throughput" (recordings/s), "latency_p50", "latency_p99"
+                        (ms per single recording), "batch_throughput" (recordings/s)}
+    """
+    import keras
+    class EpochTimer(keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.t0 = perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            times.append(perf_counter()-self.t0)
+
+    results = {}
+    for name, model in models.items():
+        times = []
+        model.fit(x=model_inputs(model, data_train), y=labels_train, epochs=epochs, batch_size=batch_size, verbose=0,
+                  callbacks=[EpochTimer()])
+        test = model_inputs(model, data_test)
+        _, accuracy = model.evaluate(x=test, y=labels_test, batch_size=batch_size, verbose=0)
+        single = model_inputs(model, data_test[:, :1])
+        model.predict_on_batch(single)                                          # Warm-up
+        latencies = []
+        for _ in range(repeat):
+            t0 = perf_counter()
+            model.predict_on_batch(single)
+            latencies.append(perf_counter()-t0)
+        t0 = perf_counter()
+        model.predict(test, batch_size=batch_size)
+        batch_time = perf_counter()-t0
+        # The first epoch includes the graph setup
+        epoch_time = np.median(times[1:]) if len(times) > 1 else times[0]
+        results[name] = {"accuracy": accuracy, "train_throughput": len(labels_train)/epoch_time,
+                         "latency_p50": 1000*np.percentile(latencies, 50), "latency_p99": 1000*np.percentile(latencies, 99),
+                         "batch_throughput": len(labels_test)/batch_time}
+    return results
+
+def main(dataFile, review_length, train_ratio, seed, epochs, batch_size, repeat):
+    print(TITLE)
+    data_train, labels_train, data_test, labels_test = load_processed_data(dataFile, review_length=review_length, pad_pos="start",
+                                                                           train_ratio=train_ratio, seed=seed)
+    print(" Training recordings: {}, test recordings: {}".format(len(labels_train), len(labels_test)))
+    branch = build_model(review_length, len(LABELS), fused=False)
+    fused = build_model(review_length, len(LABELS), fused=True)
+    copy_weights(branch, fused)                                                 # Both start from the same weights
+    difference = np.abs(branch.predict(list(data_test))-fused.predict(fuse_inputs(data_test))).max()
+    print(" Maximum prediction difference with the same weights: {:.2e}".format(difference))
+    for model in (branch, fused):
+        model.compile(loss="categorical_crossentropy", optimizer="adam", metrics=["accuracy"])
+    results = compare_models({"Branch": branch, "Fused": fused}, data_train, labels_train, data_test, labels_test,
+                             epochs=epochs, batch_size=batch_size, repeat=repeat)
+    print("\n {:<8} {:>9} {:>18} {:>14} {:>14} {:>18}".format("Model", "Accuracy", "Training (rec/s)", "Latency p50",
+                                                             "Latency p99", "Inference (rec/s)"))
+    for name, result in results.items():
+        print(" {:<8} {accuracy:>9.2%} {train_throughput:>18.1f} {latency_p50:>11.2f} ms {latency_p99:>11.2f} ms "
+              "{batch_throughput:>18.1f}".format(name, **result))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data", help="Processed data file (.csv or .npy)", type=str, required=True)
+    parser.add_argument("-l", "--length", help="Review length of each axis", type=int, default=150)
+    parser.add_argument("-r", "--ratio", help="Training ratio", type=float, default=0.5)
+    parser.add_argument("-s", "--seed", help="Seed of the train/test split", type=int, default=None)
+    parser.add_argument("-e", "--epochs", help="Training epochs of each model", type=int, default=10)
+    parser.add_argument("-b", "--batch", help="Batch size", type=int, default=10)
+    parser.add_argument("-n", "--repeat", help="Number of timed single recording predictions", type=int, default=50)
+    args = parser.parse_args()
+    main(dataFile=args.data, review_length=args.length, train_ratio=args.ratio, seed=args.seed, epochs=args.epochs,
+         batch_size=args.batch, repeat=args.repeat)
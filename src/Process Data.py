@@ -1,40 +1,116 @@
 import os.path
+import cProfile
 import argparse
 import pandas as pd
 from time import time
 from random import shuffle
+from functools import partial
 from datetime import datetime
-from Utils import getLabel, normalize, movingAvg, getFileNames, load_raw_data
+from multiprocessing import Pool
+from Utils import getLabel, load_raw_data, normalize_axes, save_processed_arrays, NORMALIZE_MODES
+from Features import FeatureStore
+from Manifest import Manifest
+import Trace
 
 TITLE = ("\n\t\t\t\t\t################" 
          "\n\t\t\t\t\t# Process Data #" 
          "\n\t\t\t\t\t################\n")
 
-def main(dataDir, movingAvgWindow, normalizeData):
+def process_file(f_name, movingAvgWindow, normalizeData, cacheDir=None, length=None, rate=None, normalizeMode="global"):
+    """
+    Loads, smooths, resamples (and normalizes) a raw csv file; the stages are cached in a FeatureStore, so only the
+    stages affected by changed parameters are computed again
+    @param f_name          : Raw csv file name
+    @param movingAvgWindow : Window width for the moving average
+    @param normalizeData   : True to normalize data
+    @param cacheDir        : Directory of the FeatureStore; None to disable the cache
+    @param length          : Number of samples per axis after resampling; None to keep the samples
+    @param rate            : Sample rate (in Hz) of the resampling; None to stretch each recording to length samples
+    @param normalizeMode   : "global", "axis" or "standard"; see Utils.normalize_axes
+    @return                : (processed data, label)
+    """
+    label = getLabel(f_name)                                                    # Get label of the data from its file name
+    if cacheDir is not None:
+        data, stats = FeatureStore(cacheDir).smoothed(f_name, movingAvgWindow, length=length, rate=rate)
+        if normalizeData:
+            with Trace.span("normalize"):
+                data = normalize_axes(data, mode=normalizeMode, stats=stats)  # From the stored statistics
+        return data.flatten(), label
+    with Trace.span("read csv"):
+        df = pd.read_csv(f_name)                                                # Load given csv file as pandas.DataFrame
+        df.columns = pd.Index(i.strip() for i in df.columns)                    # Strip redundant spaces from column names
+    data = load_raw_data(df, cols=("x", "y", "z"), movingAvgWindow=movingAvgWindow, normalizeData=normalizeData,
+                         length=length, rate=rate, normalizeMode=normalizeMode)
+    Trace.count("samples", len(df))
+    return data, label
+
+def main(dataDir, movingAvgWindow, normalizeData, jobs=1, cacheDir="Cache", outputFormat="csv", labels=None, sessions=None,
+         length=None, rate=None, normalizeMode="global"):
     print(TITLE)
     rootDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))		# Main directory of the project
-    print(" Moving Average Window: {}, Normalize Data: {}".format(movingAvgWindow, normalizeData))
+    print(" Moving Average Window: {}, Normalize Data: {}{}".format(movingAvgWindow, normalizeData,
+          " ({})".format(normalizeMode) if normalizeData else ""))
+    if length:
+        print(" Resampling: {} samples per axis{}".format(length, " at {} Hz".format(rate) if rate else ""))
     dataDir = os.path.join(rootDir, dataDir)         						# Go one directory back from rootDir and go to /Data/%data_type%
     if not os.path.exists(dataDir):
         raise OSError("Invalid directory: {}".format(dataDir))
     print(" Data directory: {}".format(dataDir))
-    files = getFileNames(dataDir)                                               # Get file names (with full address) from dataDir directory
+    manifest = Manifest(dataDir)                                                # Index of the files in dataDir directory
+    with Trace.span("manifest"):
+        changed, removed = manifest.update()
+    print(" Manifest: {} files ({} new or changed, {} removed)".format(len(manifest), changed, removed))
+    files = manifest.select(labels=labels, sessions=sessions)                   # Get file names (with full address) of selected files
+    manifest.close()
     shuffle(files)
-    out_f_name = "Processed Data {}.csv".format(datetime.now().strftime("%d.%m.%Y %H.%M"))
-    fileFullPath = os.path.join(rootDir, out_f_name)           					# Create full path of the output csv file
-    with open(fileFullPath, "w") as csv_file:
-        print(" Saving data at: {}".format(fileFullPath))
-        total_files = len(files)
-        for i, f_name in enumerate(files):
-            label = getLabel(f_name)                                            # Get label of the data from its file name
-            df = pd.read_csv(f_name)                                            # Load given csv file as pandas.DataFrame
-            df.columns = pd.Index(i.strip() for i in df.columns)                # Strip redundant spaces from column names
-            data = load_raw_data(df, cols=("x", "y", "z"), movingAvgWindow=movingAvgWindow, normalizeData=normalizeData)
-            str_data = ",".join(map(str, data))                                 # Convert values in data into string and join with ','
-            csv_file.write("{},{}\n".format(str_data, label))                   # Write data and label to the csv file 
+    if cacheDir:
+        cacheDir = os.path.join(rootDir, cacheDir)
+        os.makedirs(cacheDir, exist_ok=True)
+        print(" Cache directory: {}".format(cacheDir))
+    else:
+        cacheDir = None
+    jobs = jobs if (jobs > 0) else os.cpu_count()
+    print(" Jobs: {}".format(jobs))
+    worker = partial(process_file, movingAvgWindow=movingAvgWindow, normalizeData=normalizeData, cacheDir=cacheDir,
+                     length=length, rate=rate, normalizeMode=normalizeMode)
+    if Trace.TRACER.enabled:
+        worker = partial(Trace.traced_call, worker)                             # Stages of the workers are sent back
+    out_f_name = "Processed Data {}.{}".format(datetime.now().strftime("%d.%m.%Y %H.%M"), outputFormat)
+    fileFullPath = os.path.join(rootDir, out_f_name)           					# Create full path of the output file
+    print(" Saving data at: {}".format(fileFullPath))
+    total_files = len(files)
+    processed, labels = [], []                                                  # Collected rows for the binary format
+    csv_file = open(fileFullPath, "w") if (outputFormat == "csv") else None
+    pool = Pool(jobs) if (jobs > 1) else None
+    try:
+        # imap yields the results in the order of files, whichever worker finishes first
+        results = pool.imap(worker, files, chunksize=max(1, total_files//(8*jobs))) if pool else map(worker, files)
+        for i, result in enumerate(results):
+            if Trace.TRACER.enabled:
+                result, stages = result
+                Trace.TRACER.merge(stages)
+                Trace.count("files")
+            data, label = result
+            if csv_file:
+                with Trace.span("write csv"):
+                    str_data = ",".join(map(str, data))                         # Convert values in data into string and join with ','
+                    csv_file.write("{},{}\n".format(str_data, label))           # Write data and label to the csv file 
+            else:
+                processed.append(data)
+                labels.append(label)
             progress_ratio = (i+1)/total_files                                  # Calculate current progress
             print(" Progress : {:░<30} {:>6.2f}% ({:>3}/{:<3})".format(
-            	"█"*int(30*progress_ratio), 100*progress_ratio, i+1, total_files), end="\r")
+                "█"*int(30*progress_ratio), 100*progress_ratio, i+1, total_files), end="\r")
+    finally:
+        if csv_file:
+            csv_file.close()
+        if pool:
+            pool.close()
+            pool.join()
+    if outputFormat == "npy":
+        sources = [os.path.relpath(f_name, rootDir) for f_name in files]
+        with Trace.span("write npy"):
+            save_processed_arrays(fileFullPath, processed, labels, sources=sources)
     print("\n")
 
 if __name__ == "__main__":
@@ -43,12 +119,31 @@ if __name__ == "__main__":
     parser.add_argument("-d", "--data", help="Directory with data", type=str, default="RAW_Data")
     parser.add_argument("-w", "--width", help="Moving average window width", type=int, default=13)
     parser.add_argument("-n", "--normalize", help="True to normalize data", type=bool, default=True)
+    parser.add_argument("-j", "--jobs", help="Number of worker processes; 0 for all CPU cores", type=int, default=1)
+    parser.add_argument("-c", "--cache", help="Cache directory for processed files; empty to disable", type=str, default="Cache")
+    parser.add_argument("-f", "--format", help="Output format; 'csv' text rows or 'npy' memory-mappable arrays", type=str, default="csv", choices=("csv", "npy"))
+    parser.add_argument("-l", "--labels", help="Only process files of given labels", type=str, nargs="+", default=None)
+    parser.add_argument("-s", "--sessions", help="Only process files of given session directories", type=str, nargs="+", default=None)
+    parser.add_argument("-r", "--resample", help="Resample every recording to given samples per axis; 0 to keep the samples", type=int, default=0)
+    parser.add_argument("--rate", help="Sample rate (in Hz) of the resampling; 0 to stretch each recording to the resample length", type=float, default=0)
+    parser.add_argument("-m", "--norm-mode", help="Normalize all axes of a recording together (global), each axis to 0-1 (axis) or to mean 0 and std 1 (standard)", type=str, default="global", choices=NORMALIZE_MODES)
+    parser.add_argument("--profile", help="Save a cProfile dump and the stage summary as {PROFILE}.prof, .json and .csv", type=str, nargs="?", const="Profile", default="")
     args = parser.parse_args()
     t0 = time()    
+    profiler = None
+    if args.profile:
+        Trace.enable()
+        profiler = cProfile.Profile()
+        profiler.enable()
     try:
-        main(dataDir=args.data, movingAvgWindow=args.width, normalizeData=args.normalize)
+        main(dataDir=args.data, movingAvgWindow=args.width, normalizeData=args.normalize, jobs=args.jobs, cacheDir=args.cache,
+             outputFormat=args.format, labels=args.labels, sessions=args.sessions, length=args.resample or None, rate=args.rate or None,
+             normalizeMode=args.norm_mode)
     except Exception as ex:
         print("\n ERROR: {}".format(ex.args))
     finally:
+        if profiler:
+            profiler.disable()
+            Trace.save_profile(profiler, args.profile)
         print(" Time taken: {:.2f} s".format(time()-t0))
         input(" Press Enter to exit ")
\ No newline at end of file
@@ -0,0 +1,99 @@
+import struct
+import numpy as np
+
+# Binary frame sent by "Data Sender.py" and forwarded unchanged by "Data Receiver.py":
+#   header : magic (uint8), sequence number (uint16), timestamp of the first sample in ms (uint32), sample count (uint8)
+#   sample : time offset from the timestamp in ms (uint8), x, y, z acceleration (int16); repeated sample count times
+MAGIC = 0xA5
+HEADER = struct.Struct("<BHIB")
+SAMPLE = np.dtype([("dt", "u1"), ("x", "<i2"), ("y", "<i2"), ("z", "<i2")])    # Packed; 7 bytes
+FRAME_SAMPLES = 4                                                               # Samples per frame sent by "Data Sender.py"
+
+def encode_frame(sequence, timestamp, samples):
+    """
+    Packs samples into one binary frame
+    @param sequence  : Sequence number of the frame (wraps at 65536)
+    @param timestamp : Time of the first sample in ms
+    @param samples   : List of (time in ms, x, y, z)
+    @return          : Frame bytes
+    """
+    frame = bytearray(HEADER.pack(MAGIC, sequence % 65536, timestamp % 2**32, len(samples)))
+    for t, x, y, z in samples:
+        frame += struct.pack("<Bhhh", t-timestamp, x, y, z)
+    return bytes(frame)
+
+class FrameDecoder(object):
+    """
+    Splits the receiver byte stream into binary sample frames and text lines ("(x,y,z)", "done", "exit")
+    and keeps loss and gap statistics of the frames
+    """
+    def __init__(self, sample_period=10):
+        """
+        @param sample_period : Expected time between samples in ms; longer intervals are counted as gaps
+        """
+        self.sample_period = sample_period
+        self.buffer = b""                                                       # Incomplete message of the last feed
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.samples = 0
+        self.lost = 0                                                           # Frames missing between sequence numbers
+        self.gaps = 0                                                           # Sample intervals above 1.5 sample periods
+        self.max_interval = 0
+        self._last_sequence = None
+        self._last_time = None
+
+    def stats(self):
+        """
+        Returns the frame statistics as a dictionary
+        """
+        expected = self.frames+self.lost
+        return {"frames": self.frames, "samples": self.samples, "lost_frames": self.lost,
+                "loss_rate": self.lost/expected if expected else 0.0, "gaps": self.gaps, "max_interval_ms": self.max_interval}
+
+    def _track(self, sequence, times):
+        if self._last_sequence is not None:
+            self.lost += (sequence-self._last_sequence-1) % 65536
+        self._last_sequence = sequence
+        intervals = np.diff(times) if self._last_time is None else np.diff(times, prepend=self._last_time)
+        if len(intervals):
+            self.gaps += int(np.count_nonzero(intervals > 1.5*self.sample_period))
+            self.max_interval = max(self.max_interval, int(intervals.max()))
+        self._last_time = times[-1]
+
+    def feed(self, data):
+        """
+        Adds received bytes and returns the complete messages
+        @param data : Received bytes
+        @return     : List of ("samples", (times, array of shape (3, n))) and ("text", bytes line) in stream order
+        """
+        buffer = self.buffer+data
+        messages = []
+        start = 0
+        while start < len(buffer):
+            if buffer[start] == MAGIC:
+                if len(buffer)-start < HEADER.size:
+                    break
+                _, sequence, timestamp, count = HEADER.unpack_from(buffer, start)
+                end = start+HEADER.size+count*SAMPLE.itemsize
+                if end > len(buffer):
+                    break
+                samples = np.frombuffer(buffer, dtype=SAMPLE, count=count, offset=start+HEADER.size)   # No copy of the payload
+                times = timestamp+samples["dt"].astype(np.int64)
+                acceleration = np.stack((samples["x"], samples["y"], samples["z"]))
+                self.frames += 1
+                self.samples += count
+                if count:
+                    self._track(sequence, times)
+                messages.append(("samples", (times, acceleration)))
+            else:
+                end = buffer.find(b"\n", start)
+                if end < 0:
+                    break
+                end += 1
+                messages.append(("text", buffer[start : end]))
+                self._last_time = None                                          # No gap statistics between gestures
+            start = end
+        self.buffer = buffer[start:]
+        return messages
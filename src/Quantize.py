@@ -0,0 +1,99 @@
+import os
+import argparse
+import numpy as np
+from time import perf_counter
+from Runtime import NumpyModel, model_weights, export_quantized
+from Utils import load_processed_data
+
+TITLE = ("\n\t\t\t\t\t################"
+         "\n\t\t\t\t\t# Quantization #"
+         "\n\t\t\t\t\t################\n")
+
+def weights_size(weights):
+    """
+    @param weights : Dictionary "layer/weight name" -> array
+    @return        : Size of all arrays in bytes
+    """
+    return sum(weight.nbytes for weight in weights.values())
+
+def evaluate(predict, data_test, labels_test, batch_size=32, repeat=50):
+    """
+    Accuracy and CPU inference speed of a model on the held-out data
+    @param predict     : Function mapping a list of 3 arrays of shape (batch, 1, review_length) to label probabilities
+    @param data_test   : Array of shape (3, recordings, 1, review_length)
+    @param labels_test : One-hot-encoded labels of shape (recordings, labels)
+    @param batch_size  : Recordings per prediction for the throughput
+    @param repeat      : Number of timed single recording predictions
+    @return            : (probabilities, {"accuracy", "latency_p50", "latency_p99" (ms per single recording),
+                         "batch_throughput" (recordings/s)})
+    """
+    single = [*data_test[:, :1]]
+    predict(single)                                                             # Warm-up
+    latencies = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        predict(single)
+        latencies.append(perf_counter()-t0)
+    t0 = perf_counter()
+    probabilities = np.concatenate([predict([*data_test[:, i:i+batch_size]])
+                                    for i in range(0, data_test.shape[1], batch_size)], axis=0)
+    batch_time = perf_counter()-t0
+    accuracy = np.mean(np.argmax(probabilities, axis=1) == np.argmax(labels_test, axis=1))
+    return probabilities, {"accuracy": accuracy, "latency_p50": 1000*np.percentile(latencies, 50),
+                           "latency_p99": 1000*np.percentile(latencies, 99),
+                           "batch_throughput": data_test.shape[1]/batch_time}
+
+def main(modelFile, outputFile, dataFile, train_ratio, seed, per_channel, batch_size, repeat):
+    print(TITLE)
+    models = {}
+    if modelFile.endswith(".npz"):
+        float_model = NumpyModel(modelFile)
+        assert not float_model.spec.get("quantization"), "{} is already quantized".format(modelFile)
+    else:
+        from keras.models import load_model
+        from Models import predict_function
+        model = load_model(modelFile)
+        spec, weights = model_weights(model)
+        float_model = NumpyModel(spec=spec, weights=weights)
+        models["Keras"] = (predict_function(model), None)
+    quantized = export_quantized(float_model.spec, float_model.weights, outputFile, per_channel=per_channel)
+    int8_model = NumpyModel(outputFile)
+    models["float32"] = (float_model.predict, weights_size(float_model.weights))
+    models["int8"] = (int8_model.predict, weights_size(quantized))
+    print(" Model: {} ({:.1f} KB)".format(modelFile, os.path.getsize(modelFile)/1024))
+    print(" Exported: {} ({:.1f} KB, {})".format(outputFile, os.path.getsize(outputFile)/1024, int8_model.spec["quantization"]))
+    if not dataFile:
+        return
+    _, _, data_test, labels_test = load_processed_data(dataFile, review_length=float_model.review_length, pad_pos="start",
+                                                       train_ratio=train_ratio, seed=seed)
+    print(" Test recordings: {}".format(len(labels_test)))
+    results, probabilities = {}, {}
+    for name, (predict, size) in models.items():
+        probabilities[name], results[name] = evaluate(predict, data_test, labels_test, batch_size=batch_size, repeat=repeat)
+        results[name]["size"] = size
+    print("\n {:<8} {:>9} {:>14} {:>14} {:>14} {:>18}".format("Model", "Accuracy", "Weights (KB)", "Latency p50",
+                                                             "Latency p99", "Inference (rec/s)"))
+    for name, result in results.items():
+        size = "{:>14.1f}".format(result["size"]/1024) if result["size"] else "{:>14}".format("-")
+        print(" {:<8} {accuracy:>9.2%} {} {latency_p50:>11.2f} ms {latency_p99:>11.2f} ms {batch_throughput:>18.1f}"
+              .format(name, size, **result))
+    drop = results["float32"]["accuracy"]-results["int8"]["accuracy"]
+    agreement = np.mean(np.argmax(probabilities["float32"], axis=1) == np.argmax(probabilities["int8"], axis=1))
+    difference = np.abs(probabilities["float32"]-probabilities["int8"]).max()
+    print("\n Accuracy drop: {:.2f} percentage points, same label: {:.2%}, maximum probability difference: {:.2e}"
+          .format(100*drop, agreement, difference))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--model", help="Trained model file (.HDF5) or model exported by Runtime.py (.npz)", type=str, required=True)
+    parser.add_argument("-o", "--output", help="Quantized array file (.npz)", type=str, required=True)
+    parser.add_argument("-d", "--data", help="Processed data file to compare the float and int8 predictions", type=str, default="")
+    parser.add_argument("-r", "--ratio", help="Share of the recordings used for training; the rest is evaluated", type=float, default=0.75)
+    parser.add_argument("-s", "--seed", help="Seed of the training split; same as for training the model", type=int, default=None)
+    parser.add_argument("-c", "--per-channel", help="One scale per output unit instead of one per layer", action="store_true")
+    parser.add_argument("-b", "--batch", help="Recordings per prediction for the throughput", type=int, default=32)
+    parser.add_argument("-n", "--repeat", help="Number of timed single recording predictions", type=int, default=50)
+    args = parser.parse_args()
+    main(modelFile=args.model, outputFile=args.output, dataFile=args.data, train_ratio=args.ratio, seed=args.seed,
+         per_channel=args.per_channel, batch_size=args.batch, repeat=args.repeat)
@@ -1,36 +1,260 @@
-from microfs import ls, get, rm
 from datetime import datetime
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import ast
 import sys
 import os
 
 output_extension = ".csv"
-TITLE = ("\n\t\t\t\t\t#################" 
-         "\n\t\t\t\t\t# Read Microbit #" 
+MICROBIT_VID, MICROBIT_PID = 0x0D28, 0x0204                                         # USB ids of the BBC Micro:bit
+MANIFEST_NAME = "Transfer.json"
+TITLE = ("\n\t\t\t\t\t#################"
+         "\n\t\t\t\t\t# Read Microbit #"
          "\n\t\t\t\t\t#################\n")
 
-def main():
+def find_microbits():
+    """
+    Returns the serial ports of all connected Micro:bits
+    @return : List of (port, USB serial number)
+    """
+    from serial.tools.list_ports import comports
+    return [(port.device, port.serial_number) for port in comports() if (port.vid, port.pid) == (MICROBIT_VID, MICROBIT_PID)]
+
+class SerialBackend(object):
+    """
+    File access of one Micro:bit; several files are read or removed in one raw REPL round-trip
+    """
+    def __init__(self, port):
+        from serial import Serial
+        self.serial = Serial(port, 115200, timeout=1, parity="N")
+
+    def _execute(self, commands):
+        from microfs import execute
+        out, err = execute(commands, self.serial)
+        if err:
+            raise IOError(err.decode(errors="replace"))
+        return out
+
+    def ls(self):
+        from microfs import ls
+        return ls(serial=self.serial)
+
+    def read(self, names):
+        """
+        @param names : List of file names on the Micro:bit
+        @return      : Dictionary file name -> (size reported by the Micro:bit, content bytes)
+        """
+        commands = ["import os"]+["print(repr((os.size({0!r}), open({0!r}).read())))".format(name) for name in names]
+        lines = [line for line in self._execute(commands).decode().splitlines() if line.strip()]
+        return {name: (size, content.encode()) for name, (size, content) in zip(names, map(ast.literal_eval, lines))}
+
+    def remove(self, names):
+        self._execute(["import os"]+["os.remove({!r})".format(name) for name in names])
+
+    def close(self):
+        self.serial.close()
+
+class FakeBackend(object):
+    """
+    In-memory Micro:bit file system to measure and test transfers without hardware
+    """
+    def __init__(self, files, fail_after=None, corrupt=()):
+        """
+        @param files      : Dictionary file name -> content bytes
+        @param fail_after : Raise IOError after this many round-trips; None to never fail
+        @param corrupt    : File names whose content is truncated when read
+        """
+        self.files = dict(files)
+        self.fail_after = fail_after
+        self.corrupt = set(corrupt)
+        self.round_trips = 0
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.fail_after is not None and self.round_trips > self.fail_after:
+            raise IOError("Could not enter raw REPL")
+
+    def ls(self):
+        self._round_trip()
+        return list(self.files)
+
+    def read(self, names):
+        self._round_trip()
+        return {name: (len(self.files[name]), self.files[name][:-5] if name in self.corrupt else self.files[name]) for name in names}
+
+    def remove(self, names):
+        self._round_trip()
+        for name in names:
+            del self.files[name]
+
+    def close(self):
+        pass
+
+class TransferManifest(object):
+    """
+    Thread-safe record of copied and removed files; saved after each change so a failed transfer can be resumed
+    """
+    def __init__(self, dir_name):
+        self.f_name = os.path.join(dir_name, MANIFEST_NAME)
+        self.lock = Lock()
+        self.entries = {}                                                           # "device/file" -> entry dictionary
+        if os.path.exists(self.f_name):
+            with open(self.f_name, "r") as in_file:
+                self.entries = json.load(in_file)
+
+    def _save(self):
+        tmp_name = "{}.tmp".format(self.f_name)
+        with open(tmp_name, "w") as out_file:
+            json.dump(self.entries, out_file, indent=1)
+        os.replace(tmp_name, self.f_name)
+
+    def target(self, device, name, label):
+        """
+        Returns the destination file name of a Micro:bit file; new files get the next free index
+        """
+        with self.lock:
+            key = "{}/{}".format(device, name)
+            if self.entries.get(key, {}).get("state") == "removed":
+                # New recording with the name of an already moved file; keep the old entry under another key
+                self.entries["{}#{}".format(key, len(self.entries))] = self.entries.pop(key)
+            if key not in self.entries:
+                index = len(self.entries)
+                self.entries[key] = {"target": "{}{}{}".format(label, index, output_extension), "state": "pending"}
+                self._save()
+            return self.entries[key]["target"]
+
+    def state(self, device, name):
+        with self.lock:
+            return self.entries.get("{}/{}".format(device, name), {}).get("state")
+
+    def mark(self, device, names, state, **info):
+        with self.lock:
+            for name in names:
+                self.entries["{}/{}".format(device, name)].update(state=state, **info.get(name, {}))
+            self._save()
+
+def verify(f_name, size, content):
+    """
+    Checks a local file against a file read from the Micro:bit: the size reported by the Micro:bit (catches truncated
+    reads) and the content (catches failed writes and, on resume, a new recording with the name of a copied file)
+    @param f_name  : Local file name
+    @param size    : Size of the file reported by os.size on the Micro:bit
+    @param content : Content read from the Micro:bit
+    @return        : Number of data rows; raises IOError on mismatch
+    """
+    local_size = os.path.getsize(f_name)
+    if local_size != size or local_size != len(content):
+        raise IOError("Size mismatch of {}: {} bytes copied, {} bytes on the Micro:bit".format(f_name, local_size, size))
+    with open(f_name, "rb") as in_file:
+        if in_file.read() != content:
+            raise IOError("Content mismatch of {}".format(f_name))
+    return content.count(b"\n")-1                                                 # Without header
+
+def transfer(backend, device, manifest, dir_name, name, batch_size=8, progress=None):
+    """
+    Moves all csv files of one Micro:bit to dir_name; files are removed only after their copy was verified
+    @param backend    : SerialBackend or FakeBackend of the Micro:bit
+    @param device     : Unique id of the Micro:bit, e.g. its USB serial number
+    @param manifest   : TransferManifest of dir_name
+    @param dir_name   : Destination directory
+    @param name       : Name of the movement; prefix of the destination files
+    @param batch_size : Number of files read or removed in one round-trip
+    @param progress   : Function called with the number of moved files after each batch
+    @return           : Number of moved files
+    """
+    csv_files = [file for file in backend.ls() if file.endswith(output_extension)]
+    # Files verified before a failure only need to be removed, unless the Micro:bit recorded a new file of that name
+    verified = [file for file in csv_files if manifest.state(device, file) == "verified"]
+    remaining = [file for file in csv_files if file not in verified]
+    unchanged, changed = [], []
+    if verified:
+        contents = backend.read(verified)
+        for file in verified:
+            f_name = os.path.join(dir_name, manifest.target(device, file, name))
+            if not os.path.exists(f_name):
+                remaining.append(file)                                              # Local copy lost; copied again
+                continue
+            try:
+                verify(f_name, *contents[file])
+                unchanged.append(file)
+            except IOError:
+                changed.append(file)
+    if changed:
+        manifest.mark(device, changed, "removed")                                   # The earlier copy stays; new target below
+        remaining += changed
+    if unchanged:
+        backend.remove(unchanged)
+        manifest.mark(device, unchanged, "removed")
+    moved = len(unchanged)
+    for start in range(0, len(remaining), batch_size):
+        batch = remaining[start : start+batch_size]
+        contents = backend.read(batch)
+        info = {}
+        for file in batch:
+            size, content = contents[file]
+            f_name = os.path.join(dir_name, manifest.target(device, file, name))
+            with open(f_name, "wb") as out_file:
+                out_file.write(content)
+            info[file] = {"size": size, "rows": verify(f_name, size, content)}
+        manifest.mark(device, batch, "verified", **info)
+        backend.remove(batch)
+        manifest.mark(device, batch, "removed")
+        moved += len(batch)
+        if progress:
+            progress(len(batch))
+    return moved
+
+def main(resume_dir=None, batch_size=8, backends=None):
     print(TITLE)
-    csv_files = [file for file in ls() if file.endswith(output_extension)]          # Load all csv file names from the Microbit
-    if not csv_files:
-        print(" No '{}' files to copy!".format(output_extension))
+    if backends is None:
+        backends = {serial_number: SerialBackend(port) for port, serial_number in find_microbits()}
+    if not backends:
+        print(" No Micro:bit connected!")
         return 0
-    name = input(" Enter target name: ")
-    name = name.capitalize() if name else "Unnamed"
-    # Create sub-directory in RAW_Data directory 
-    dir_name = os.path.join("RAW_Data", "{} {}".format(name, datetime.now().strftime("%d %m %Y %H-%M")))
+    print(" Connected Micro:bits: {}".format(len(backends)))
+    if resume_dir:
+        dir_name = resume_dir
+        name = os.path.basename(os.path.normpath(dir_name)).split(" ")[0]
+    else:
+        name = input(" Enter target name: ")
+        name = name.capitalize() if name else "Unnamed"
+        # Create sub-directory in RAW_Data directory
+        dir_name = os.path.join("RAW_Data", "{} {}".format(name, datetime.now().strftime("%d %m %Y %H-%M")))
     os.makedirs(dir_name, exist_ok=True)                                            # Make the sub-directory if it doesn't exist
+    manifest = TransferManifest(dir_name)
+    moved = [0]
+    lock = Lock()
+    def progress(n):
+        with lock:
+            moved[0] += n
+            print(" Progress: {:>4} files".format(moved[0]), end="\r")
     print()
-    for i, file in enumerate(csv_files):
-        print(" Progress: {:<50}  ({}/{})".format("█"*int(50*(i+1)/len(csv_files)), i+1, len(csv_files)), end="\r")
-        f_name = "{}{}{}".format(name, i, output_extension)                         # Prepare file name at destination directory
-        get(file, os.path.join(dir_name, f_name))                                   # Copy file from Microbit to given directory as f_name
-        rm(file)                                                                    # Remove file from Microbit
-    print("\n\n {} files moved to '{}'".format(i+1, dir_name))
-    return 0
+    # One worker per serial port
+    with ThreadPoolExecutor(max_workers=len(backends)) as executor:
+        futures = {device: executor.submit(transfer, backend, device, manifest, dir_name, name, batch_size, progress)
+                   for device, backend in backends.items()}
+    failed = 0
+    for device, future in futures.items():
+        backends[device].close()
+        if future.exception() is not None:
+            failed += 1
+            print("\n ERROR ({}): {}".format(device, future.exception()))
+    total = sum(entry["state"] == "removed" for entry in manifest.entries.values())
+    print("\n\n {} files moved to '{}'".format(total, dir_name))
+    if failed:
+        print(" Run again with --resume \"{}\" to continue".format(dir_name))
+    return 1 if failed else 0
 
 if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--resume", help="Continue a failed transfer into given directory", type=str, default=None)
+    parser.add_argument("-b", "--batch", help="Number of files copied or removed per serial round-trip", type=int, default=8)
+    args = parser.parse_args()
     try:
-        main()
+        main(resume_dir=args.resume, batch_size=args.batch)
     except Exception as ex:
         print("\n ERROR: {}".format(ex.args))
     finally:
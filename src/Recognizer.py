@@ -0,0 +1,342 @@
+import argparse
+import threading
+import numpy as np
+from time import sleep, perf_counter
+from collections import namedtuple
+from queue import Queue, Empty
+from Utils import MovingAvgStream, pad_indexes, resample_batch, normalize_axes, getFileNames, LABELS, NORMALIZE_MODES
+from Protocol import FrameDecoder, encode_frame, MAGIC, FRAME_SAMPLES
+import Trace
+
+TITLE = ("\n\t\t\t\t\t##############"
+         "\n\t\t\t\t\t# Recognizer #"
+         "\n\t\t\t\t\t##############\n")
+
+# Prediction of one received gesture; timings are in seconds
+Prediction = namedtuple("Prediction", ("label", "probabilities", "samples", "timings"))
+
+class ReplaySource(object):
+    """
+    Byte source that replays raw csv files as the "Data Receiver.py" UART stream; drop-in for serial.Serial
+    """
+    def __init__(self, f_names, interval=0.0, exit_token=True, binary=False):
+        """
+        @param f_names    : List of raw csv file names; each file is sent as one gesture followed by "done"
+        @param interval   : Delay (in seconds) between samples to emulate the sample period
+        @param exit_token : True to send "exit" after the last file
+        @param binary     : True to send the samples as binary frames of Protocol.py instead of "(x,y,z)" lines
+        """
+        self.interval = interval
+        self.binary = binary
+        self._lines = self._generate(f_names, exit_token, binary)
+        self._pending = b""
+
+    @staticmethod
+    def _generate(f_names, exit_token, binary, sample_period=10):
+        sequence = timestamp = 0
+        for f_name in f_names:
+            with open(f_name, "r") as csv_file:
+                next(csv_file)                                                  # Skip the header
+                # x, y and z only; files of "Collect Data.py" also have the sample time column t
+                rows = [",".join(row.strip().replace(" ", "").split(",")[:3]) for row in csv_file if row.strip()]
+            if binary:
+                for start in range(0, len(rows), FRAME_SAMPLES):
+                    samples = [(timestamp+i*sample_period, *map(int, row.split(",")))
+                               for i, row in enumerate(rows[start : start+FRAME_SAMPLES])]
+                    yield encode_frame(sequence, timestamp, samples)
+                    sequence += 1
+                    timestamp += len(samples)*sample_period
+            else:
+                for row in rows:
+                    yield "({})\n".format(row).encode()
+            yield b"done\n"
+        if exit_token:
+            yield b"exit\n"
+
+    def readline(self):
+        """
+        Returns the next line; empty bytes once all files are sent (like a serial timeout)
+        """
+        if self.interval:
+            sleep(self.interval)
+        return next(self._lines, b"")
+
+    @property
+    def in_waiting(self):
+        """
+        Number of bytes available to read(); waits for the next line or frame if none is pending
+        """
+        if not self._pending:
+            self._pending = self.readline()
+            if self.interval and self._pending[:1] == bytes((MAGIC,)):
+                sleep(self.interval*(FRAME_SAMPLES-1))                          # A frame carries several samples
+        return len(self._pending)
+
+    def read(self, size=1):
+        """
+        Returns up to size bytes of the stream
+        """
+        if not self._pending:
+            self.in_waiting
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def close(self):
+        pass
+
+class RingBuffer(object):
+    """
+    Fixed-size buffer of the latest (x, y, z) samples
+    """
+    def __init__(self, capacity, axes=3):
+        self.data = np.empty((axes, capacity), dtype=np.float64)
+        self.capacity = capacity
+        self.size = 0                                                           # Number of valid samples
+        self.index = 0                                                          # Next write position
+        self.dropped = False                                                    # True once old samples were overwritten
+
+    def extend(self, samples):
+        """
+        Appends samples of shape (axes, n); the oldest samples are overwritten once the buffer is full
+        """
+        n = samples.shape[-1]
+        self.dropped = self.dropped or (self.size+n > self.capacity)
+        if n >= self.capacity:
+            self.data[:] = samples[:, -self.capacity:]
+            self.index, self.size = 0, self.capacity
+            return
+        positions = (self.index+np.arange(n)) % self.capacity
+        self.data[:, positions] = samples
+        self.index = (self.index+n) % self.capacity
+        self.size = min(self.size+n, self.capacity)
+
+    def values(self):
+        """
+        Returns the valid samples in the order they were received
+        """
+        start = (self.index-self.size) % self.capacity
+        return self.data[:, (start+np.arange(self.size)) % self.capacity]
+
+    def clear(self):
+        self.size = self.index = 0
+        self.dropped = False
+
+class GestureRecognizer(object):
+    """
+    Reads the receiver stream on a background thread, smooths the samples on arrival and predicts each gesture
+    """
+    def __init__(self, source, predict, review_length=150, movingAvgWindow=13, normalizeData=True, pad_pos="start",
+                 binary=False, resample=False, normalizeMode="global", rate=None):
+        """
+        @param source          : Object with readline() returning bytes (text mode) or read() and in_waiting
+                                 (binary mode), e.g. serial.Serial or ReplaySource
+        @param predict         : Function mapping a list of 3 arrays of shape (batch, 1, review_length) to
+                                 label probabilities, e.g. model.predict of a trained model
+        @param review_length   : Length of each axis after padding; longer gestures keep their latest samples
+        @param movingAvgWindow : Window width for the moving average
+        @param normalizeData   : True to normalize data
+        @param pad_pos         : "start" or "end"; padding position of the gesture
+        @param binary          : True if the sender uses binary frames (BINARY_MODE of "Data Sender.py")
+        @param resample        : True to resample the gesture to review_length instead of padding; gestures of up to
+                                 4 times review_length samples are kept completely
+        @param normalizeMode   : "global", "axis" or "standard"; same as for the processed training data
+        @param rate            : Sample rate (in Hz) of the resampling; same as for the processed training data. None
+                                 to stretch each gesture to review_length. The samples are taken as 10 ms apart
+        """
+        self.source = source
+        self.predict = predict
+        self.review_length = review_length
+        self.movingAvgWindow = movingAvgWindow
+        self.normalizeData = normalizeData
+        self.normalizeMode = normalizeMode
+        self.pad_pos = pad_pos
+        self.resample = resample
+        self.rate = rate
+        self.capacity = 4*review_length if resample else review_length         # Samples kept per gesture
+        self.decoder = FrameDecoder() if binary else None                       # Frame, loss and gap statistics
+        self.gestures = Queue()                                                 # Received gestures waiting for prediction
+        self.malformed = 0                                                      # Skipped text lines that are no "(x,y,z)" sample
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._read, name="Serial reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _receive(self):
+        """
+        Reads the next messages of the stream
+        @return : List of ("samples", array of shape (3, n)) and ("text", bytes line)
+        """
+        if self.decoder is not None:
+            data = self.source.read(self.source.in_waiting or 1)
+            return [(kind, value[1] if kind == "samples" else value) for kind, value in self.decoder.feed(data)]
+        line = self.source.readline()
+        if not line:
+            return []
+        if b"," in line:
+            try:
+                values = np.array(line.strip(b"()\r\n").split(b","), dtype=np.float64)
+            except ValueError:
+                values = None
+            if values is None or len(values) != 3:                             # Partial read, noise or dropped comma
+                self.malformed += 1
+                Trace.count("malformed lines")
+                return []
+            return [("samples", values[:, np.newaxis])]
+        return [("text", line)]
+
+    def _read(self):
+        """
+        Reader thread: parses "(x,y,z)" lines or binary frames, smooths them incrementally and queues each gesture on "done"
+        """
+        buffer = RingBuffer(self.capacity)
+        stream = MovingAvgStream(window=self.movingAvgWindow)
+        min_val, max_val = np.full(3, np.inf), np.full(3, -np.inf)              # Running range of each smoothed axis
+        t_first = smooth_time = None
+        running = True
+        try:
+            while running and not self._stop.is_set():
+                with Trace.span("serial read"):                                 # Mostly waiting for the receiver
+                    messages = self._receive()
+                for kind, value in messages:
+                    if kind == "samples":
+                        Trace.count("samples", value.shape[-1])
+                        t0 = perf_counter()
+                        if t_first is None:
+                            t_first, smooth_time = t0, 0.0
+                        smooth = stream.push(value.astype(np.float64))
+                        if smooth.shape[-1]:
+                            buffer.extend(smooth)
+                            min_val, max_val = np.minimum(min_val, smooth.min(axis=-1)), np.maximum(max_val, smooth.max(axis=-1))
+                        smooth_time += perf_counter()-t0
+                    elif value.startswith(b"done"):
+                        if t_first is None:
+                            continue                                            # "done" without any sample
+                        t0 = perf_counter()
+                        tail = stream.flush()
+                        if tail.shape[-1]:
+                            buffer.extend(tail)
+                            min_val, max_val = np.minimum(min_val, tail.min(axis=-1)), np.maximum(max_val, tail.max(axis=-1))
+                        samples = buffer.values()
+                        if buffer.dropped:
+                            min_val, max_val = samples.min(axis=-1), samples.max(axis=-1)   # Range of the kept samples only
+                        timings = {"receive": t0-t_first, "smooth": smooth_time+perf_counter()-t0}
+                        self.gestures.put((samples, min_val, max_val, t0, timings))
+                        buffer.clear()
+                        min_val, max_val = np.full(3, np.inf), np.full(3, -np.inf)
+                        t_first = None
+                    elif value.startswith(b"exit"):
+                        running = False
+                        break
+        finally:
+            self.gestures.put(None)                                             # End of stream, also after a reader error
+
+    def _prepare(self, samples, min_val, max_val):
+        """
+        Normalizes and pads (or resamples) smoothed samples of shape (3, n) into the model input
+        @return : List of 3 arrays of shape (1, 1, review_length)
+        """
+        if self.resample:
+            # Same order as load_raw_data: smooth, resample, normalize
+            samples = resample_batch(samples[np.newaxis], self.review_length, rate=self.rate)[0]
+            if self.normalizeData:
+                samples = normalize_axes(samples, mode=self.normalizeMode)
+            return list(samples[:, np.newaxis, np.newaxis, :])
+        if self.normalizeData:
+            # The running range avoids a pass over the samples; standardization needs their mean and std
+            stats = {"min": min_val, "max": max_val} if self.normalizeMode != "standard" else None
+            samples = normalize_axes(samples, mode=self.normalizeMode, stats=stats)
+        indexes = pad_indexes(samples.shape[-1], self.review_length, pad_pos=self.pad_pos)
+        return list(samples[:, np.newaxis, np.newaxis, indexes])
+
+    def results(self, timeout=None):
+        """
+        Generator of predictions for received gestures until the stream sends "exit"
+        @param timeout : Maximum waiting time (in seconds) for each gesture; None to wait forever
+        @return        : Generator of Prediction
+        """
+        while True:
+            try:
+                item = self.gestures.get(timeout=timeout)
+            except Empty:
+                return
+            if item is None:
+                return
+            samples, min_val, max_val, t_done, timings = item
+            t0 = perf_counter()
+            final_data = self._prepare(samples, min_val, max_val)
+            t1 = perf_counter()
+            probabilities = np.asarray(self.predict(final_data))[0]
+            t2 = perf_counter()
+            timings.update(prepare=t1-t0, predict=t2-t1, latency=t2-t_done)
+            for stage, seconds in timings.items():
+                Trace.TRACER.add("gesture "+stage, seconds)
+            yield Prediction(LABELS[int(np.argmax(probabilities))], probabilities, samples.shape[-1], timings)
+
+def main(modelFile, port, replayDir, movingAvgWindow, binary, resample, reportFile="", normalizeMode="global", rate=None):
+    print(TITLE)
+    if reportFile:
+        Trace.enable()
+    if modelFile.endswith(".npz"):
+        from Runtime import NumpyModel
+        model = NumpyModel(modelFile)                                           # Exported model; no Keras import
+        predict = model.predict
+    else:
+        from keras.models import load_model
+        from Models import predict_function
+        model = load_model(modelFile)
+        predict = predict_function(model)                                       # Branch or fused model
+    print(" Model: {}".format(modelFile))
+    if replayDir:
+        source = ReplaySource(getFileNames(replayDir), interval=0.01, binary=binary)
+        print(" Replaying: {}".format(replayDir))
+    else:
+        import serial
+        source = serial.Serial(port=port, baudrate=115200, bytesize=8, parity="N", stopbits=1, timeout=0.5)
+        print(" Port: {}".format(port))
+    recognizer = GestureRecognizer(source, predict, movingAvgWindow=movingAvgWindow, binary=binary,
+                                   resample=resample, normalizeMode=normalizeMode, rate=rate).start()
+    try:
+        print(" Waiting for data")
+        for prediction in recognizer.results():
+            print(" Predicted motion: {:<6} ({} samples) | {}".format(prediction.label.upper(), prediction.samples,
+                  ", ".join("{}: {:.1f} ms".format(stage, 1000*t) for stage, t in prediction.timings.items())))
+            if recognizer.malformed:
+                print(" Skipped malformed lines: {}".format(recognizer.malformed))
+            if recognizer.decoder is not None:
+                print(" Frames: {frames}, lost: {lost_frames} ({loss_rate:.1%}), gaps: {gaps}, max interval: {max_interval_ms} ms"
+                      .format(**recognizer.decoder.stats()))
+    finally:
+        recognizer.stop()
+        source.close()
+        if reportFile:
+            Trace.TRACER.print_summary()
+            Trace.TRACER.report(reportFile)
+            print(" Saved: {}".format(reportFile))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--model", help="Trained model file (.HDF5) or model exported by Runtime.py (.npz)", type=str, required=True)
+    parser.add_argument("-p", "--port", help="Serial port of the receiver Micro:bit", type=str, default="COM5")
+    parser.add_argument("-r", "--replay", help="Replay raw csv files from given directory instead of the serial port", type=str, default="")
+    parser.add_argument("-w", "--width", help="Moving average window width", type=int, default=13)
+    parser.add_argument("-b", "--binary", help="Receive binary frames (BINARY_MODE of \"Data Sender.py\")", action="store_true")
+    parser.add_argument("--resample", help="Resample gestures to the review length (model trained on resampled data)", action="store_true")
+    parser.add_argument("--rate", help="Sample rate (in Hz) of the resampling; same as --rate of Process Data.py, 0 to stretch each gesture", type=float, default=0)
+    parser.add_argument("--report", help="Save the stage timings as JSON (.json) or csv file", type=str, default="")
+    parser.add_argument("--norm-mode", help="Normalization mode of the training data (see Process Data.py)", type=str, default="global", choices=NORMALIZE_MODES)
+    args = parser.parse_args()
+    try:
+        main(modelFile=args.model, port=args.port, replayDir=args.replay, movingAvgWindow=args.width, binary=args.binary,
+             resample=args.resample, reportFile=args.report, normalizeMode=args.norm_mode,
+             rate=args.rate or None)
+    except KeyboardInterrupt:
+        pass
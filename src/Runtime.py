@@ -0,0 +1,207 @@
+import json
+import argparse
+import numpy as np
+from time import perf_counter
+
+TITLE = ("\n\t\t\t\t\t#################"
+         "\n\t\t\t\t\t# NumPy Runtime #"
+         "\n\t\t\t\t\t#################\n")
+
+# Keras activations used by the gesture models
+ACTIVATIONS = {"linear": lambda x: x,
+               "relu": lambda x: np.maximum(x, 0),
+               "tanh": np.tanh,
+               "sigmoid": lambda x: 1/(1+np.exp(-x)),
+               "hard_sigmoid": lambda x: np.clip(0.2*x+0.5, 0, 1),
+               "softmax": lambda x: (lambda e: e/e.sum(axis=-1, keepdims=True))(np.exp(x-x.max(axis=-1, keepdims=True)))}
+
+def model_weights(model):
+    """
+    Layer specification and weights of a trained gesture model (shared layers, Concatenate and head layers)
+    @param model : Keras model built like in "Train Gesture Reader.ipynb"; shared LSTM and Dense layers applied to
+                   each axis input via execute_layers, concatenated and passed through the head Dense layers.
+                   Fused models (Models.fused_model) have the same weights and are exported the same way
+    @return      : (layer specification, dictionary "layer/weight name" -> float32 array)
+    """
+    spec = {"shared": [], "head": [], "layers": {}}
+    arrays = {}
+    part = "shared"
+    for layer in model.layers:
+        layer_type = layer.__class__.__name__
+        if layer_type in ("InputLayer", "Reshape"):
+            continue
+        if layer_type in ("Concatenate", "Flatten"):                            # Flatten joins the axes of fused models
+            part = "head"
+            continue
+        layer_name = layer.name
+        if layer_type == "TimeDistributed":                                     # Shared LSTM of fused models
+            layer = layer.layer
+            layer_type = layer.__class__.__name__
+        assert layer_type in ("LSTM", "Dense"), "Unsupported layer {} ({})".format(layer_name, layer_type)
+        config = layer.get_config()
+        weights = layer.get_weights()
+        spec[part].append(layer_name)
+        spec["layers"][layer_name] = {"type": layer_type, "activation": config["activation"],
+                                      "recurrent_activation": config.get("recurrent_activation")}
+        names = ("kernel", "recurrent_kernel", "bias") if (layer_type == "LSTM") else ("kernel", "bias")
+        if not config.get("use_bias", True):
+            names = names[:-1]
+        for name, weight in zip(names, weights):
+            arrays["{}/{}".format(layer_name, name)] = weight.astype(np.float32)
+    return spec, arrays
+
+def export_model(model, f_name):
+    """
+    Saves the weights of a trained gesture model as an array file
+    @param model  : Keras model; see model_weights
+    @param f_name : Output file name (.npz)
+    @return       : Layer specification saved in the file
+    """
+    spec, arrays = model_weights(model)
+    np.savez(f_name, spec=np.array(json.dumps(spec)), **arrays)
+    return spec
+
+def quantize_weights(weights, per_channel=False):
+    """
+    Symmetric int8 post-training quantization of the kernels; w ~ scale*q with q in -127..127. Biases are small and
+    stay float32
+    @param weights     : Dictionary "layer/weight name" -> float array, e.g. of model_weights
+    @param per_channel : True for one scale per output unit (kernel column) instead of one scale per kernel
+    @return            : Dictionary with the int8 kernels, their float32 scales as "layer/weight name/scale" and the biases
+    """
+    quantized = {}
+    for key, weight in weights.items():
+        if key.endswith("/bias"):
+            quantized[key] = weight
+            continue
+        max_abs = np.abs(weight).max(axis=0 if per_channel else None)
+        scale = (np.where(max_abs > 0, max_abs, 1)/127).astype(np.float32)     # All-zero kernels keep scale 1/127
+        quantized[key] = np.clip(np.round(weight/scale), -127, 127).astype(np.int8)
+        quantized[key+"/scale"] = scale
+    return quantized
+
+def dequantize_weights(weights):
+    """
+    Inverse of quantize_weights; float32 kernels for the BLAS matrix products of the forward pass
+    """
+    return {key: (weight*weights[key+"/scale"]).astype(np.float32) if (key+"/scale" in weights) else weight
+            for key, weight in weights.items() if not key.endswith("/scale")}
+
+def export_quantized(spec, weights, f_name, per_channel=False):
+    """
+    Saves a model like export_model with int8 kernels; about a quarter of the size. NumpyModel loads both files
+    @param spec        : Layer specification, e.g. NumpyModel.spec
+    @param weights     : Dictionary "layer/weight name" -> float array, e.g. NumpyModel.weights
+    @param f_name      : Output file name (.npz)
+    @param per_channel : True for one scale per output unit instead of one scale per kernel
+    @return            : Quantized weights saved in the file
+    """
+    quantized = quantize_weights(weights, per_channel=per_channel)
+    spec = dict(spec, quantization="int8 per-channel" if per_channel else "int8 per-layer")
+    np.savez(f_name, spec=np.array(json.dumps(spec)), **quantized)
+    return quantized
+
+class NumpyModel(object):
+    """
+    Forward pass of an exported gesture model with NumPy only; predict() matches keras Model.predict
+    """
+    def __init__(self, f_name=None, spec=None, weights=None):
+        """
+        @param f_name  : Array file saved by export_model or export_quantized
+        @param spec    : Layer specification; used instead of f_name together with weights
+        @param weights : Dictionary "layer/weight name" -> float array; used instead of f_name together with spec
+        """
+        if f_name is not None:
+            with np.load(f_name) as model_file:
+                spec = json.loads(str(model_file["spec"]))
+                weights = {key: model_file[key] for key in model_file.files if key != "spec"}
+        if spec.get("quantization"):
+            weights = dequantize_weights(weights)                               # Computed in float32 like the original
+        self.spec = spec
+        self.weights = weights
+
+    @property
+    def review_length(self):
+        """
+        Input length of each axis
+        """
+        return self.weights["{}/kernel".format(self.spec["shared"][0])].shape[0]
+
+    def _layer(self, name, x):
+        """
+        Applies one LSTM or Dense layer to x
+        @param name : Layer name
+        @param x    : (batch, timesteps, features) for LSTM, (batch, features) for Dense
+        @return     : Layer output of shape (batch, units)
+        """
+        layer = self.spec["layers"][name]
+        kernel = self.weights["{}/kernel".format(name)]
+        bias = self.weights.get("{}/bias".format(name), 0)
+        activation = ACTIVATIONS[layer["activation"]]
+        if layer["type"] == "Dense":
+            return activation(x @ kernel + bias)
+        recurrent_activation = ACTIVATIONS[layer["recurrent_activation"]]
+        recurrent_kernel = self.weights["{}/recurrent_kernel".format(name)]
+        units = recurrent_kernel.shape[0]
+        h = np.zeros((x.shape[0], units), dtype=np.float32)
+        c = np.zeros((x.shape[0], units), dtype=np.float32)
+        inputs = x @ kernel + bias                                              # Input part of all timesteps at once
+        for t in range(x.shape[1]):
+            z = inputs[:, t]+h @ recurrent_kernel
+            # Gate order of the Keras kernels: input, forget, cell, output
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2*units])
+            c = f*c+i*activation(z[:, 2*units:3*units])
+            o = recurrent_activation(z[:, 3*units:])
+            h = o*activation(c)
+        return h
+
+    def predict(self, inputs):
+        """
+        @param inputs : List of x, y and z arrays of shape (batch, 1, review_length) or stacked array of shape
+                        (batch, 3, review_length) like the input of fused models
+        @return       : Label probabilities of shape (batch, labels)
+        """
+        if isinstance(inputs, np.ndarray) and inputs.ndim == 3:
+            inputs = list(inputs.transpose(1, 0, 2)[:, :, np.newaxis])
+        # The shared layers process all axes as one batch of size 3*batch
+        output = np.concatenate([np.asarray(_input, dtype=np.float32) for _input in inputs], axis=0)
+        for name in self.spec["shared"]:
+            output = self._layer(name, output)
+        output = np.concatenate(np.split(output, len(inputs), axis=0), axis=-1)  # Concatenate in input order
+        for name in self.spec["head"]:
+            output = self._layer(name, output)
+        return output
+
+def main(modelFile, outputFile, dataFile, review_length):
+    from keras.models import load_model
+    from Models import predict_function
+    from Utils import load_processed_data
+    print(TITLE)
+    model = load_model(modelFile)
+    keras_predict = predict_function(model)                                     # Branch or fused model
+    export_model(model, outputFile)
+    print(" Exported: {}".format(outputFile))
+    t0 = perf_counter()
+    runtime = NumpyModel(outputFile)
+    print(" NumPy model load time: {:.2f} ms".format(1000*(perf_counter()-t0)))
+    if dataFile:
+        _, _, data_test, labels_test = load_processed_data(dataFile, review_length=review_length, pad_pos="start")
+        for name, predict in (("Keras", keras_predict), ("NumPy", runtime.predict)):
+            t0 = perf_counter()
+            probabilities = predict([*data_test])
+            t = perf_counter()-t0
+            accuracy = np.mean(np.argmax(probabilities, axis=1) == np.argmax(labels_test, axis=1))
+            print(" {:<5}: accuracy {:.2f}%, {:.2f} ms for {} samples".format(name, 100*accuracy, 1000*t, len(labels_test)))
+        difference = np.abs(keras_predict([*data_test])-runtime.predict([*data_test])).max()
+        print(" Maximum probability difference: {:.2e}".format(difference))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--model", help="Trained model file", type=str, required=True)
+    parser.add_argument("-o", "--output", help="Exported array file", type=str, required=True)
+    parser.add_argument("-d", "--data", help="Processed data file to compare the predictions", type=str, default="")
+    parser.add_argument("-l", "--length", help="Review length of the model", type=int, default=150)
+    args = parser.parse_args()
+    main(modelFile=args.model, outputFile=args.output, dataFile=args.data, review_length=args.length)
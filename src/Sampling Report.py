@@ -0,0 +1,88 @@
+import os
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+from Manifest import Manifest
+
+TITLE = ("\n\t\t\t\t\t###################"
+         "\n\t\t\t\t\t# Sampling Report #"
+         "\n\t\t\t\t\t###################\n")
+
+def read_times(f_name):
+    """
+    Returns the sample times of a raw csv file
+    @param f_name : Raw csv file name
+    @return       : Integer array of the "t" column in ms; None for files without sample times
+    """
+    with open(f_name, "r") as in_file:
+        header = [col.strip() for col in in_file.readline().split(",")]
+    if "t" not in header:
+        return None
+    return pd.read_csv(f_name, usecols=[header.index("t")]).values[:, 0]
+
+def session_stats(dataDir, period=10, duration=1500, review_length=150):
+    """
+    Sample count and sample interval statistics of every session directory
+    @param dataDir       : Directory with raw data
+    @param period        : Nominal sample period in ms
+    @param duration      : Recording time in ms; estimates the mean sample interval of files without sample times
+    @param review_length : Padded length of the processed data; used to report padded and truncated samples
+    @return              : List of dictionaries, one per session
+    """
+    manifest = Manifest(dataDir)
+    manifest.update()
+    rows = manifest.connection.execute("SELECT session, path, rows FROM files ORDER BY session, path").fetchall()
+    manifest.close()
+    stats = []
+    sessions = sorted(set(session for session, _, _ in rows))
+    for session in sessions:
+        paths = [path for _session, path, _ in rows if _session == session]
+        counts = np.array([count for _session, _, count in rows if _session == session])
+        entry = {"session": session, "files": len(paths), "samples_min": counts.min(), "samples_mean": counts.mean(),
+                 "samples_max": counts.max(), "samples_std": counts.std(), "interval_estimate": duration/counts.mean(),
+                 "padded": np.maximum(review_length-counts, 0).sum()/(review_length*len(counts)),
+                 "truncated": np.maximum(counts-review_length, 0).sum()/counts.sum()}
+        times = [read_times(os.path.join(manifest.dataDir, path)) for path in paths]
+        intervals = [np.diff(t) for t in times if t is not None]
+        if intervals:
+            timed_files = len(intervals)
+            intervals = np.concatenate(intervals)
+            entry.update(timed_files=timed_files, interval_mean=intervals.mean(), interval_std=intervals.std(),
+                         interval_max=intervals.max(initial=0), late=np.mean(intervals > 1.5*period) if len(intervals) else 0.0)
+        stats.append(entry)
+    return stats
+
+def main(dataDir, period, duration, review_length, outputFile):
+    print(TITLE)
+    stats = session_stats(dataDir, period=period, duration=duration, review_length=review_length)
+    if not stats:
+        print(" No raw data in {}".format(dataDir))
+        return
+    print(" {:<26} {:>5} {:>18} {:>8} {:>9} {:>9} {:>22}".format("Session", "Files", "Samples min/mean/max", "Std",
+                                                                 "Padded", "Truncated", "Interval mean/std/max"))
+    for entry in stats:
+        interval = "{:.1f}/{:.1f}/{} ms".format(entry["interval_mean"], entry["interval_std"], entry["interval_max"]) \
+                   if "interval_mean" in entry else "~{:.1f} ms (count)".format(entry["interval_estimate"])
+        print(" {session:<26} {files:>5} {samples_min:>5}/{samples_mean:>6.1f}/{samples_max:<5} {samples_std:>8.1f} "
+              "{padded:>9.1%} {truncated:>9.1%} {interval:>22}".format(interval=interval, **entry))
+    mean = sum(entry["samples_mean"]*entry["files"] for entry in stats)/sum(entry["files"] for entry in stats)
+    print("\n Mean samples per recording: {:.1f}; a --resample length for Process Data.py".format(mean))
+    if outputFile:
+        fields = list(max(stats, key=len))
+        with open(outputFile, "w", newline="") as out_file:
+            writer = csv.DictWriter(out_file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(stats)
+        print(" Saved: {}".format(outputFile))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data", help="Directory with raw data", type=str, default="RAW_Data")
+    parser.add_argument("-p", "--period", help="Nominal sample period in ms", type=int, default=10)
+    parser.add_argument("-t", "--duration", help="Recording time in ms", type=int, default=1500)
+    parser.add_argument("-l", "--length", help="Review length of the padded data", type=int, default=150)
+    parser.add_argument("-o", "--output", help="Save the statistics as csv file", type=str, default="")
+    args = parser.parse_args()
+    main(dataDir=args.data, period=args.period, duration=args.duration, review_length=args.length, outputFile=args.output)
@@ -0,0 +1,243 @@
+import json
+import argparse
+import threading
+import numpy as np
+from time import perf_counter
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Utils import load_raw_batch, LABELS, NORMALIZE_MODES
+import Trace
+
+TITLE = ("\n\t\t\t\t\t####################"
+         "\n\t\t\t\t\t# Inference Server #"
+         "\n\t\t\t\t\t####################\n")
+
+class Stats(object):
+    """
+    Thread-safe counters of served requests and batches
+    """
+    def __init__(self, max_records=10000):
+        self.lock = threading.Lock()
+        self.t_start = perf_counter()
+        self.requests = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=max_records)                              # Latest request latencies (in seconds)
+        self.batch_sizes = deque(maxlen=max_records)                            # Latest batch sizes
+
+    def add_batch(self, latencies):
+        with self.lock:
+            self.requests += len(latencies)
+            self.batches += 1
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(len(latencies))
+
+    def summary(self):
+        """
+        Returns the counters as a dictionary; latencies in milliseconds
+        """
+        with self.lock:
+            latencies = 1000*np.array(self.latencies)
+            batch_sizes = np.array(self.batch_sizes)
+            requests, batches = self.requests, self.batches
+        elapsed = perf_counter()-self.t_start
+        percentile = lambda q: float(np.percentile(latencies, q)) if len(latencies) else 0.0
+        return {"requests": requests, "batches": batches,
+                "throughput": requests/elapsed,
+                "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+                "max_batch_size": int(batch_sizes.max()) if len(batch_sizes) else 0,
+                "p50_latency_ms": percentile(50), "p99_latency_ms": percentile(99)}
+
+class MicroBatcher(object):
+    """
+    Collects recordings from many clients and predicts them together in one batch
+    """
+    def __init__(self, predict, review_length=150, movingAvgWindow=13, normalizeData=True, pad_pos="start",
+                 max_batch=32, max_wait=0.005, resample=False, normalizeMode="global",
+                 rate=None):
+        """
+        @param predict         : Function mapping a list of 3 arrays of shape (batch, 1, review_length) to
+                                 label probabilities of shape (batch, labels), e.g. model.predict
+        @param review_length   : Length of each axis after padding
+        @param movingAvgWindow : Window width for the moving average
+        @param normalizeData   : True to normalize data
+        @param pad_pos         : "start" or "end"; padding position of the recordings
+        @param max_batch       : Maximum number of recordings in one batch
+        @param max_wait        : Maximum time (in seconds) to wait for more recordings after the first one
+        @param resample        : True to resample the recordings to review_length instead of padding
+        @param normalizeMode   : "global", "axis" or "standard"; same as for the processed training data
+        @param rate            : Sample rate (in Hz) of the resampling; same as for the processed training data. None
+                                 to stretch each recording to review_length
+        """
+        self.predict = predict
+        self.review_length = review_length
+        self.movingAvgWindow = movingAvgWindow
+        self.normalizeData = normalizeData
+        self.normalizeMode = normalizeMode
+        self.pad_pos = pad_pos
+        self.resample = resample
+        self.rate = rate
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = Stats()
+        self.requests = Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Micro batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, recording):
+        """
+        Queues a recording for prediction
+        @param recording : Array of shape (samples, 3) with raw x, y and z acceleration readings
+        @return          : concurrent.futures.Future with the label probabilities
+        """
+        future = Future()
+        self.requests.put((np.asarray(recording), future, perf_counter()))
+        return future
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _collect(self):
+        """
+        Waits for the first request and collects more until the batch is full or max_wait has passed
+        """
+        batch = [self.requests.get(timeout=0.1)]
+        deadline = perf_counter()+self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline-perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._collect()
+            except Empty:
+                continue
+            recordings, futures, t_submit = zip(*batch)
+            Trace.count("requests", len(batch))
+            try:
+                with Trace.span("preprocess"):
+                    data = load_raw_batch(recordings, self.review_length, movingAvgWindow=self.movingAvgWindow,
+                                          normalizeData=self.normalizeData, pad_pos=self.pad_pos,
+                                          resample=self.resample, normalizeMode=self.normalizeMode,
+                                          rate=self.rate)
+                with Trace.span("predict"):
+                    probabilities = np.asarray(self.predict(list(data)))
+            except Exception as ex:
+                for future in futures:
+                    future.set_exception(ex)
+                continue
+            t_done = perf_counter()
+            for future, _probabilities in zip(futures, probabilities):
+                future.set_result(_probabilities)
+            self.stats.add_batch([t_done-t for t in t_submit])
+
+def make_handler(batcher):
+    """
+    Returns a request handler class serving the given batcher
+    @param batcher : MicroBatcher
+    @return        : BaseHTTPRequestHandler subclass
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, content):
+            body = json.dumps(content).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._reply(200, batcher.stats.summary())
+            else:
+                self._reply(404, {"error": "Unknown path {}".format(self.path)})
+
+        def do_POST(self):
+            """
+            /predict with a JSON body {"samples": [[x, y, z], ...]}
+            """
+            if self.path != "/predict":
+                self._reply(404, {"error": "Unknown path {}".format(self.path)})
+                return
+            try:
+                content = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                recording = np.array(content["samples"], dtype=np.int64).reshape(-1, 3)
+                if not len(recording):
+                    raise ValueError("No samples received")
+            except (ValueError, KeyError, TypeError) as ex:
+                self._reply(400, {"error": str(ex)})
+                return
+            try:
+                probabilities = batcher.submit(recording).result()
+            except Exception as ex:
+                self._reply(500, {"error": str(ex)})
+                return
+            self._reply(200, {"label": LABELS[int(np.argmax(probabilities))], "probabilities": probabilities.tolist()})
+
+        def log_message(self, *args):
+            pass                                                                # Keep the console for the counters
+
+    return Handler
+
+def main(modelFile, port, maxBatch, maxWait, movingAvgWindow, resample, reportFile="", normalizeMode="global", rate=None):
+    print(TITLE)
+    if reportFile:
+        Trace.enable()
+    # Loaded once for all clients
+    if modelFile.endswith(".npz"):
+        from Runtime import NumpyModel
+        model = NumpyModel(modelFile)
+        predict = model.predict
+        review_length = model.review_length
+    else:
+        from keras.models import load_model
+        from Models import predict_function
+        model = load_model(modelFile)
+        predict = predict_function(model)                                       # Branch or fused model
+        review_length = int(model.inputs[0].shape[-1])
+    print(" Model: {}, Review length: {}".format(modelFile, review_length))
+    batcher = MicroBatcher(predict, review_length=review_length, movingAvgWindow=movingAvgWindow,
+                           max_batch=maxBatch, max_wait=maxWait, resample=resample,
+                           normalizeMode=normalizeMode, rate=rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(batcher))
+    print(" Serving at http://127.0.0.1:{} (POST /predict, GET /stats)".format(port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.close()
+        print("\n {}".format(batcher.stats.summary()))
+        if reportFile:
+            Trace.TRACER.print_summary()
+            Trace.TRACER.report(reportFile)
+            print(" Saved: {}".format(reportFile))
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--model", help="Trained model file (.HDF5) or model exported by Runtime.py (.npz)", type=str, required=True)
+    parser.add_argument("-p", "--port", help="Local port of the server", type=int, default=8000)
+    parser.add_argument("-b", "--batch", help="Maximum batch size", type=int, default=32)
+    parser.add_argument("-t", "--wait", help="Maximum wait for a batch to fill (in ms)", type=float, default=5)
+    parser.add_argument("-w", "--width", help="Moving average window width", type=int, default=13)
+    parser.add_argument("-r", "--resample", help="Resample recordings to the review length (model trained on resampled data)", action="store_true")
+    parser.add_argument("--rate", help="Sample rate (in Hz) of the resampling; same as --rate of Process Data.py, 0 to stretch each recording", type=float, default=0)
+    parser.add_argument("--report", help="Save the stage timings as JSON (.json) or csv file on shutdown", type=str, default="")
+    parser.add_argument("--norm-mode", help="Normalization mode of the training data (see Process Data.py)", type=str, default="global", choices=NORMALIZE_MODES)
+    args = parser.parse_args()
+    try:
+        main(modelFile=args.model, port=args.port, maxBatch=args.batch, maxWait=args.wait/1000, movingAvgWindow=args.width,
+             resample=args.resample, reportFile=args.report, normalizeMode=args.norm_mode,
+             rate=args.rate or None)
+    except KeyboardInterrupt:
+        pass
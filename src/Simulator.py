@@ -0,0 +1,202 @@
+import io
+import sys
+import struct
+import types
+import runpy
+import random
+import argparse
+import numpy as np
+
+TITLE = ("\n\t\t\t\t\t#############"
+         "\n\t\t\t\t\t# Simulator #"
+         "\n\t\t\t\t\t#############\n")
+
+class SimulationEnd(Exception):
+    """
+    Raised inside the script once the simulated time is over
+    """
+
+class Image(object):
+    """
+    Stand-in for microbit.Image; only keeps the pattern
+    """
+    def __init__(self, pattern=""):
+        self.pattern = pattern
+
+    def __repr__(self):
+        return "Image({!r})".format(self.pattern)
+
+for _name in ("HAPPY", "SAD", "YES", "NO", "TARGET", "ARROW_N", "ARROW_E", "ARROW_S", "ARROW_W"):
+    setattr(Image, _name, Image(_name))
+
+class Button(object):
+    def __init__(self, device, name):
+        self.device = device
+        self.name = name
+        self._checked = 0                                                       # Time of the last was_pressed call
+
+    def is_pressed(self):
+        return any(start <= self.device.time < end for start, end, name in self.device.presses if name == self.name)
+
+    def was_pressed(self):
+        pressed = any(self._checked < start <= self.device.time for start, end, name in self.device.presses if name == self.name)
+        self._checked = self.device.time
+        return pressed
+
+class SimulatedFile(io.StringIO):
+    """
+    Text file of the simulated flash; each write takes time like on the Micro:bit
+    """
+    def __init__(self, device, name, content=""):
+        super().__init__(content)
+        self.device = device
+        self.name = name
+
+    def write(self, data):
+        self.device.flash_write(len(data))
+        self.device.writes += 1
+        return super().write(data)
+
+    def close(self):
+        if not self.closed:
+            self.device.files[self.name] = self.getvalue()
+        super().close()
+
+class Microbit(object):
+    """
+    Host-side simulation of one BBC Micro:bit running a MicroPython script on a virtual clock; provides the
+    microbit, micropython and radio modules and a flash file system with write latency
+    """
+    def __init__(self, acceleration=None, presses=(), sample_period=10, read_time=0.3, write_time=(1.0, 0.02),
+                 erase_prob=0.05, erase_time=12.0, max_time=60000, seed=None):
+        """
+        @param acceleration  : Array of shape (samples, 3) returned by accelerometer.get_values() at sample_period;
+                               None for random values
+        @param presses       : List of (start, end, button) in ms; button "a" or "b", both for simultaneous presses
+        @param sample_period : Time (in ms) between the rows of acceleration
+        @param read_time     : Time (in ms) of one accelerometer reading
+        @param write_time    : (time per write call, time per byte) in ms of flash writes
+        @param erase_prob    : Probability of a write waiting for a flash page erase
+        @param erase_time    : Time (in ms) of a flash page erase
+        @param max_time      : Simulated time (in ms) after which the script is stopped
+        @param seed          : Seed of the random write delays and accelerations
+        """
+        self.random = random.Random(seed)
+        if acceleration is None:
+            acceleration = np.random.RandomState(seed).randint(-1024, 1024, size=(1000, 3))
+        self.acceleration = np.asarray(acceleration, dtype=np.int64)
+        self.presses = [(start, end, name) for start, end, names in presses for name in names]
+        self.sample_period = sample_period
+        self.read_time = read_time
+        self.write_time = write_time
+        self.erase_prob = erase_prob
+        self.erase_time = erase_time
+        self.max_time = max_time
+        self.time = 0.0                                                         # Simulated time in ms
+        self.files = {}                                                         # File name -> content
+        self.writes = 0
+        self.display = []                                                       # (time, shown item)
+        self.sent = []                                                          # (time, radio message)
+        self.inbox = []                                                         # Radio messages to receive
+        self.uart = bytearray()
+
+    def advance(self, ms):
+        self.time += ms
+        if self.time > self.max_time:
+            raise SimulationEnd()
+
+    def flash_write(self, size):
+        ms = self.write_time[0]+self.write_time[1]*size
+        if self.random.random() < self.erase_prob:
+            ms += self.erase_time
+        self.advance(ms)
+
+    def open(self, name, mode="r"):
+        if "r" in mode:
+            return io.StringIO(self.files[name])
+        return SimulatedFile(self, name, self.files.get(name, "") if "a" in mode else "")
+
+    def modules(self):
+        """
+        Returns the simulated modules by name
+        """
+        device = self
+        microbit = types.ModuleType("microbit")
+        microbit.Image = Image
+        microbit.button_a = Button(self, "a")
+        microbit.button_b = Button(self, "b")
+        microbit.running_time = lambda: int(device.time)
+        microbit.sleep = lambda ms: device.advance(max(ms, 0))
+        def get_values():
+            device.advance(device.read_time)
+            return tuple(int(value) for value in device.acceleration[int(device.time//device.sample_period) % len(device.acceleration)])
+        microbit.accelerometer = types.SimpleNamespace(get_values=get_values,
+                                                       get_x=lambda: get_values()[0], get_y=lambda: get_values()[1],
+                                                       get_z=lambda: get_values()[2])
+        def show(image, delay=400, wait=True, loop=False, clear=False):
+            device.display.append((device.time, image))
+            if wait and isinstance(image, (list, tuple, str)):
+                device.advance(len(image)*delay)
+        microbit.display = types.SimpleNamespace(show=show, scroll=lambda text, delay=150, **kwargs: show(str(text), delay),
+                                                 clear=lambda: device.display.append((device.time, None)),
+                                                 set_pixel=lambda x, y, value: None, get_pixel=lambda x, y: 0)
+        microbit.uart = types.SimpleNamespace(init=lambda *args, **kwargs: None, close=lambda: None,
+                                              write=lambda data: device.uart.extend(data.encode() if isinstance(data, str) else data))
+        micropython = types.ModuleType("micropython")
+        micropython.const = lambda value: value
+        radio = types.ModuleType("radio")
+        radio.RATE_250KBIT, radio.RATE_1MBIT, radio.RATE_2MBIT = 0, 1, 2
+        radio.on = radio.off = radio.reset = lambda: None
+        radio.config = lambda **kwargs: None
+        radio.send_bytes = lambda data: device.sent.append((device.time, bytes(data)))
+        radio.send = lambda text: radio.send_bytes(b"\x01\x00\x01"+text.encode())
+        radio.receive_bytes = lambda: device.inbox.pop(0) if device.inbox else None
+        radio.receive = lambda: (lambda data: None if data is None else data[3:].decode())(radio.receive_bytes())
+        return {"microbit": microbit, "micropython": micropython, "radio": radio, "ustruct": struct}
+
+    def run(self, f_name):
+        """
+        Runs a MicroPython script until it returns or the simulated time is over
+        @param f_name : Script file name, e.g. "src/Collect Data.py"
+        @return       : self
+        """
+        modules = self.modules()
+        saved = {name: sys.modules.get(name) for name in modules}
+        sys.modules.update(modules)
+        try:
+            runpy.run_path(f_name, init_globals={"open": self.open}, run_name="__main__")
+        except SimulationEnd:
+            pass
+        finally:
+            for name, module in saved.items():
+                if module is None:
+                    del sys.modules[name]
+                else:
+                    sys.modules[name] = module
+        return self
+
+def main(scriptFile, recordings, seed):
+    print(TITLE)
+    # Select the number of recordings with button B, confirm with A and B, then start each recording with A;
+    # presses last longer than the 200 ms button polling of the script
+    presses = [(500+400*i, 750+400*i, "b") for i in range(recordings-1)]
+    start = 500+400*recordings
+    presses += [(start, start+250, "ab")]+[(start+4000*i, start+4000*i+250, "a") for i in range(1, recordings+1)]
+    device = Microbit(presses=presses, max_time=start+4000*(recordings+1), seed=seed).run(scriptFile)
+    print(" Simulated time: {:.1f} s, flash writes: {}".format(device.time/1000, device.writes))
+    for name, content in sorted(device.files.items()):
+        rows = [line.split(",") for line in content.splitlines()]
+        line = " {}: {} samples".format(name, len(rows)-1)
+        if "t" in rows[0] and len(rows) > 2:
+            intervals = np.diff([int(row[rows[0].index("t")]) for row in rows[1:]])
+            line += ", interval {:.2f} +- {:.2f} ms (max {} ms)".format(intervals.mean(), intervals.std(), intervals.max())
+        print(line)
+
+if __name__ == "__main__":
+    # Getting arguments from the command prompt
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--script", help="MicroPython script to simulate", type=str, default="src/Collect Data.py")
+    parser.add_argument("-n", "--recordings", help="Number of recordings to collect", type=int, default=3)
+    parser.add_argument("--seed", help="Seed of the simulated delays", type=int, default=None)
+    args = parser.parse_args()
+    main(scriptFile=args.script, recordings=args.recordings, seed=args.seed)
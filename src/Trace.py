@@ -0,0 +1,225 @@
+import os
+import csv
+import json
+import bisect
+import threading
+import numpy as np
+from functools import wraps
+from time import perf_counter
+
+# Upper edges (in seconds) of the duration histogram buckets: 1 us to ~137 s in steps of 2; the last bucket is unbounded
+EDGES = 1e-6*2.0**np.arange(28)
+_EDGES = EDGES.tolist()                                                         # bisect on a list is faster for single values
+
+def _percentile(buckets, q, _min, _max):
+    """
+    Percentile q (0-1) of a duration histogram; linear within the bucket, bounded by the minimum and maximum
+    """
+    cumulative = np.cumsum(buckets)
+    target = q*cumulative[-1]
+    bucket = int(np.searchsorted(cumulative, target))
+    lower = max(EDGES[bucket-1] if bucket > 0 else 0.0, _min)
+    upper = min(EDGES[bucket] if bucket < len(EDGES) else np.inf, _max)
+    before = cumulative[bucket-1] if bucket > 0 else 0
+    return float(lower+(upper-lower)*(target-before)/buckets[bucket])
+
+class _NoSpan(object):
+    """
+    Context manager of disabled spans; shared, does nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Span(object):
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, perf_counter()-self.t0)
+        return False
+
+class Tracer(object):
+    """
+    Duration histograms of named stages and counters; disabled tracers only check one attribute per call
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.pid = os.getpid() if enabled else None                             # Process that reports the stages
+        self.stages = {}                                                        # Name -> [count, total, min, max, buckets]
+        self.counters = {}                                                      # Name -> value
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """
+        Context manager timing the enclosed code as stage name
+        """
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def add(self, name, seconds):
+        """
+        Records one duration of stage name, e.g. measured by the caller
+        """
+        if not self.enabled:
+            return
+        bucket = bisect.bisect_left(_EDGES, seconds)
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = [0, 0.0, np.inf, 0.0, np.zeros(len(EDGES)+1, dtype=np.int64)]
+            stage[0] += 1
+            stage[1] += seconds
+            stage[2] = min(stage[2], seconds)
+            stage[3] = max(stage[3], seconds)
+            stage[4][bucket] += 1
+
+    def count(self, name, value=1):
+        """
+        Adds value to counter name, e.g. processed files or bytes
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0)+value
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """
+        Picklable copy of the recorded stages and counters, e.g. to send them from a worker process
+        """
+        with self._lock:
+            return {"stages": {name: [stage[0], stage[1], stage[2], stage[3], stage[4].copy()] for name, stage in self.stages.items()},
+                    "counters": dict(self.counters)}
+
+    def merge(self, snapshot):
+        """
+        Adds the stages and counters of a snapshot, e.g. of a worker process
+        """
+        with self._lock:
+            for name, (count, total, _min, _max, buckets) in snapshot["stages"].items():
+                stage = self.stages.get(name)
+                if stage is None:
+                    self.stages[name] = [count, total, _min, _max, buckets.copy()]
+                else:
+                    stage[0] += count
+                    stage[1] += total
+                    stage[2] = min(stage[2], _min)
+                    stage[3] = max(stage[3], _max)
+                    stage[4] += buckets
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0)+value
+
+    def summary(self):
+        """
+        Statistics of every stage; percentiles are interpolated within their histogram bucket
+        @return : List of dictionaries sorted by total time
+        """
+        rows = []
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+        for name, (count, total, _min, _max, buckets) in stages:
+            rows.append({"stage": name, "count": count, "total_s": total, "mean_ms": 1000*total/count,
+                         "min_ms": 1000*_min, "p50_ms": 1000*_percentile(buckets, 0.5, _min, _max),
+                         "p90_ms": 1000*_percentile(buckets, 0.9, _min, _max),
+                         "p99_ms": 1000*_percentile(buckets, 0.99, _min, _max), "max_ms": 1000*_max,
+                         "histogram": {"{:g}".format(1000*edge): int(n) for edge, n in zip(np.append(EDGES, np.inf), buckets) if n}})
+        return rows
+
+    def report(self, f_name):
+        """
+        Saves the summary as JSON (.json) or csv file; histograms map the upper bucket edges in ms to counts
+        """
+        rows = self.summary()
+        if f_name.endswith(".json"):
+            with open(f_name, "w") as out_file:
+                json.dump({"stages": rows, "counters": self.counters}, out_file, indent=1)
+            return
+        with open(f_name, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(("stage", "count", "total_s", "mean_ms", "min_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms", "histogram"))
+            for row in rows:
+                histogram = ";".join("{}:{}".format(edge, n) for edge, n in row.pop("histogram").items())
+                writer.writerow(list(row.values())+[histogram])
+            for name, value in sorted(self.counters.items()):
+                writer.writerow(("counter:"+name, value))
+
+    def print_summary(self):
+        rows = self.summary()
+        total = sum(row["total_s"] for row in rows) or 1
+        print(" {:<24} {:>8} {:>10} {:>7} {:>10} {:>10} {:>10}".format("Stage", "Count", "Total (s)", "Share", "Mean (ms)",
+                                                                     "p50 (ms)", "p99 (ms)"))
+        for row in rows:
+            print(" {stage:<24} {count:>8} {total_s:>10.3f} {share:>7.1%} {mean_ms:>10.3f} {p50_ms:>10.3f} {p99_ms:>10.3f}"
+                  .format(share=row["total_s"]/total, **row))
+        for name, value in sorted(self.counters.items()):
+            print(" {:<24} {:>8}".format(name, value))
+
+# Tracer of the current process; enabled by the scripts, e.g. with --profile
+TRACER = Tracer()
+
+def span(name):
+    return TRACER.span(name)
+
+def count(name, value=1):
+    TRACER.count(name, value)
+
+def enable(enabled=True):
+    TRACER.enabled = enabled
+    TRACER.pid = os.getpid()
+
+def timed(name):
+    """
+    Decorator recording each call of a function as stage name
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with _Span(TRACER, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traced_call(func, *args, **kwargs):
+    """
+    Calls func with tracing enabled in the current (worker) process
+    @return : (result, snapshot of the stages recorded during the call) for Tracer.merge; empty in the process that
+              enabled the tracer, which records the stages directly
+    """
+    if TRACER.enabled and TRACER.pid == os.getpid():
+        return func(*args, **kwargs), {"stages": {}, "counters": {}}
+    TRACER.enabled = True                                                       # Forked workers also drop the copied stages
+    TRACER.reset()
+    result = func(*args, **kwargs)
+    return result, TRACER.snapshot()
+
+def save_profile(profiler, name, top=15):
+    """
+    Saves a cProfile run and the stage summary of the tracer
+    @param profiler : Stopped cProfile.Profile
+    @param name     : Output name; writes {name}.prof (e.g. for snakeviz or pstats), {name}.json and {name}.csv
+    @param top      : Number of functions with the highest cumulative time to print
+    """
+    import pstats
+    profiler.dump_stats(name+".prof")
+    print("\n Functions with the highest cumulative time:")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+    print(" Stages:")
+    TRACER.print_summary()
+    TRACER.report(name+".json")
+    TRACER.report(name+".csv")
+    print(" Saved: {0}.prof, {0}.json, {0}.csv".format(name))
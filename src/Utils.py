@@ -1,7 +1,9 @@
-import os.path
+import os
 import numpy as np
+from Trace import span
 
 LABELS = ("ideal","up", "down", "left", "right")
+NORMALIZE_MODES = ("global", "axis", "standard")
 
 def getLabel(file_name):
     """
@@ -21,9 +23,53 @@ def normalize(data):
     @param data : 1D numpy array with values
     @return     : 1D numpy array with normalized values
     """
-    min_val, max_val = min(data), max(data)
+    min_val, max_val = np.min(data), np.max(data)
     return (data - min_val)/(max_val - min_val)
 
+def axis_stats(data, lengths=None, valid=None):
+    """
+    Minimum, maximum, mean and standard deviation of each axis
+    @param data    : Array of shape (..., n), e.g. (3, n) for one recording or (recordings, 3, n)
+    @param lengths : Optional array broadcastable to data.shape[:-1] with the valid length of each row (for padded rows)
+    @param valid   : Optional boolean array broadcastable to data.shape marking the valid samples; used instead of
+                     lengths, e.g. for rows padded at the start
+    @return        : Dictionary "min", "max", "mean", "std" -> array of shape data.shape[:-1]
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if lengths is None and valid is None:
+        return {"min": data.min(axis=-1), "max": data.max(axis=-1), "mean": data.mean(axis=-1), "std": data.std(axis=-1)}
+    if valid is None:
+        valid = np.arange(data.shape[-1]) < np.asarray(lengths)[..., np.newaxis]
+    count = np.maximum(valid.sum(axis=-1), 1)
+    mean = np.where(valid, data, 0).sum(axis=-1)/count
+    return {"min": np.where(valid, data, np.inf).min(axis=-1), "max": np.where(valid, data, -np.inf).max(axis=-1),
+            "mean": mean, "std": np.sqrt(np.where(valid, (data-mean[..., np.newaxis])**2, 0).sum(axis=-1)/count)}
+
+def normalize_axes(data, mode="global", stats=None, lengths=None):
+    """
+    Normalizes the axes of one or many recordings in one step
+    @param data    : Array of shape (..., 3, n)
+    @param mode    : "global"   - All axes of a recording together to the value range 0-1 (like normalize of the
+                                  flattened axes)
+                     "axis"     - Each axis to the value range 0-1
+                     "standard" - Each axis to mean 0 and standard deviation 1
+    @param stats   : axis_stats of data, e.g. stored by the FeatureStore; None to compute them
+    @param lengths : Valid length of each row for padded data; only used to compute the statistics
+    @return        : Normalized array of the same shape
+    """
+    if stats is None:
+        stats = axis_stats(data, lengths=lengths)
+    if mode == "standard":
+        std = np.asarray(stats["std"])
+        return (data-np.asarray(stats["mean"])[..., np.newaxis])/np.where(std > 0, std, 1)[..., np.newaxis]
+    min_val, max_val = np.asarray(stats["min"]), np.asarray(stats["max"])
+    if mode == "global":
+        min_val, max_val = min_val.min(axis=-1, keepdims=True), max_val.max(axis=-1, keepdims=True)
+    elif mode != "axis":
+        raise ValueError("Invalid normalization mode: {}; expected one of {}".format(mode, NORMALIZE_MODES))
+    value_range = max_val-min_val
+    return (data-min_val[..., np.newaxis])/np.where(value_range > 0, value_range, 1)[..., np.newaxis]
+
 def movingAvg(data, window=5):
     """
     Moving average function for smoothing the data with given window width
@@ -31,7 +77,64 @@ def movingAvg(data, window=5):
     @param window : Window size for calculating average
     @return       : Smooth 1D numpy array
     """
-    return np.array([np.ma.average(data[i : i+window]) for i in range(len(data))])
+    return movingAvgBatch(np.asarray(data), window=window)
+
+def movingAvgBatch(data, window=5, lengths=None):
+    """
+    Moving average over the last axis of an N-D array using cumulative sums; all axes and recordings in one call
+    @param data    : Array of shape (..., n) e.g. (3, n) for x, y, z or (recordings, 3, n) for padded recordings
+    @param window  : Window size for calculating average; window shrinks at the end of each row
+    @param lengths : Optional array of shape data.shape[:-1] with the valid length of each row (for padded rows);
+                     values after the valid length are set to 0
+    @return        : Smooth numpy array with the same shape as data
+    """
+    data = np.asarray(data)
+    n = data.shape[-1]
+    # Integer data is summed exactly in int64, everything else in float64
+    sum_dtype = np.int64 if np.issubdtype(data.dtype, np.integer) else np.float64
+    cum_sum = np.zeros(data.shape[:-1]+(n+1,), dtype=sum_dtype)
+    np.cumsum(data, axis=-1, dtype=sum_dtype, out=cum_sum[..., 1:])
+    start = np.arange(n)
+    if lengths is None:
+        end = np.minimum(start+window, n)                               # Shrinking window at the tail
+        return (cum_sum[..., end]-cum_sum[..., start])/(end-start)
+    lengths = np.asarray(lengths)[..., np.newaxis]
+    end = np.minimum(start+window, lengths)                             # Shrinking window at the tail of each row
+    count = end-start
+    window_sum = np.take_along_axis(cum_sum, end, axis=-1)-cum_sum[..., start]
+    return np.where(count > 0, window_sum/np.maximum(count, 1), 0.0)
+
+class MovingAvgStream(object):
+    """
+    Streaming form of movingAvgBatch; keeps the last (window-1) samples between chunks
+    """
+    def __init__(self, window=5):
+        self.window = window
+        self.buffer = None
+
+    def push(self, chunk):
+        """
+        Add a chunk of samples and return the averages of all complete windows
+        @param chunk : Array of shape (..., m) with new samples on the last axis
+        @return      : Smooth array of shape (..., k); k is the number of windows completed by this chunk
+        """
+        chunk = np.asarray(chunk)
+        if self.buffer is not None:
+            chunk = np.concatenate((self.buffer, chunk), axis=-1)
+        complete = max(chunk.shape[-1]-self.window+1, 0)                # Number of windows with all samples available
+        self.buffer = chunk[..., complete:]
+        return movingAvgBatch(chunk, window=self.window)[..., :complete]
+
+    def flush(self):
+        """
+        Return the averages of the remaining shrinking tail windows and reset the stream
+        @return : Smooth array of shape (..., window-1) or None if no samples were pushed
+        """
+        if self.buffer is None:
+            return None
+        tail = movingAvgBatch(self.buffer, window=self.window)
+        self.buffer = None
+        return tail
 
 def getFileNames(dataDir, extension=".csv"):
     """
@@ -41,12 +144,12 @@ def getFileNames(dataDir, extension=".csv"):
     @return          : List of file names (with subdirectory addresses)
     """
     file_names = []
-    for name in os.listdir(dataDir):
-        abs_path = os.path.join(dataDir, name)              # Absolute address of current file/directory
-        if os.path.isdir(abs_path):
-            file_names += getFileNames(abs_path, extension=extension)
-        elif abs_path.endswith(extension):
-            file_names.append(abs_path)
+    with os.scandir(dataDir) as entries:                    # Directory entries cache their type; no extra stat calls
+        for entry in entries:
+            if entry.is_dir():
+                file_names.extend(getFileNames(entry.path, extension=extension))
+            elif entry.name.endswith(extension):
+                file_names.append(entry.path)
     return file_names
 
 def pad_constant(array, max_length, pad_pos="end"):
@@ -84,46 +187,202 @@ def execute_layers(inputs, layers):
         outputs.append(_output)
     return outputs
 
-def load_processed_data(f_name, review_length, pad_pos="end", train_ratio=0.75):
+def meta_file_name(f_name):
+    """
+    Returns the name of the metadata file that belongs to a processed array file
+    @param f_name : Processed array file name (.npy)
+    @return       : Metadata file name (.meta.npz)
+    """
+    return "{}.meta.npz".format(os.path.splitext(f_name)[0])
+
+def save_processed_arrays(f_name, data, labels, sources=None):
+    """
+    Saves processed recordings as one fixed-shape float32 array file and a metadata file
+    @param f_name  : Array file name (.npy); metadata is saved next to it (see meta_file_name)
+    @param data    : List of processed 1D arrays with x, y and z acceleration stacked one after another
+    @param labels  : List of label indexes
+    @param sources : List of source file names of the recordings
+    @return        : Nothing
+    """
+    lengths = np.array([len(_data)//3 for _data in data], dtype=np.int32)       # Sample points per axis
+    array = np.lib.format.open_memmap(f_name, mode="w+", dtype=np.float32, shape=(len(data), 3, int(lengths.max(initial=1))))
+    for i, (_data, length) in enumerate(zip(data, lengths)):
+        _data = np.reshape(_data, (3, length))
+        array[i, :, :length] = _data
+        array[i, :, length:] = _data[:, -1:]                                    # Pad at the end with ending value
+    array.flush()
+    del array
+    np.savez(meta_file_name(f_name), labels=np.array(labels, dtype=np.int16), lengths=lengths,
+             sources=np.array(sources if sources is not None else [""]*len(data), dtype=str))
+
+def pad_indexes(lengths, review_length, pad_pos="end"):
+    """
+    Returns the source index of every padded sample point; same padding as pad_constant for many arrays at once
+    @param lengths       : Array with the length of each array to pad
+    @param review_length : Length of the arrays after padding (longer arrays are truncated at the padding side)
+    @param pad_pos       : "start" - Pad at the beginning with initial value
+                           "end"   - Pad at the end with ending value
+    @return              : Integer array of shape lengths.shape+(review_length,)
+    """
+    lengths = np.asarray(lengths)[..., np.newaxis]
+    steps = np.arange(review_length)
+    if pad_pos.lower() == "start":
+        return np.maximum(steps-(review_length-lengths), 0)
+    return np.minimum(steps, lengths-1)
+
+def resample_indexes(times, lengths, length, rate=None):
+    """
+    Returns the positions of a linear interpolation to a fixed number of samples for many recordings at once
+    @param times   : Array of shape (recordings, samples) with the sample times in ms; rising within each recording,
+                     values after the length of a recording are ignored
+    @param lengths : Array with the number of samples of each recording
+    @param length  : Number of samples after resampling
+    @param rate    : Sample rate in Hz; None to spread the samples evenly from the first to the last sample time.
+                     Samples after the last sample time repeat the last value
+    @return        : (left index, right index, weight of the right sample), each of shape (recordings, length)
+    """
+    times = np.asarray(times, dtype=np.float64)
+    lengths = np.asarray(lengths)
+    rows = np.arange(len(times))[:, np.newaxis]
+    first = times[:, :1]
+    last = times[rows[:, 0], lengths-1][:, np.newaxis]
+    if rate is None:
+        targets = first+(last-first)*np.linspace(0, 1, length)
+    else:
+        targets = np.minimum(first+np.arange(length)*(1000/rate), last)
+    # One search for all recordings: every recording is shifted to its own time range
+    span = (last-first).max(initial=0)+1
+    shifted = np.where(np.arange(times.shape[-1]) < lengths[:, np.newaxis], times-first, span)+rows*(span+1)
+    positions = np.searchsorted(shifted.ravel(), (targets-first+rows*(span+1)).ravel(), side="right").reshape(targets.shape)
+    left = np.clip(positions-1-rows*times.shape[-1], 0, np.maximum(lengths-2, 0)[:, np.newaxis])
+    right = np.minimum(left+1, (lengths-1)[:, np.newaxis])
+    t_left = np.take_along_axis(times, left, axis=-1)
+    t_diff = np.take_along_axis(times, right, axis=-1)-t_left
+    weight = np.where(t_diff > 0, (targets-t_left)/np.where(t_diff > 0, t_diff, 1), 0.0)
+    return left, right, weight
+
+def resample_batch(data, length, lengths=None, times=None, rate=None, period=10):
+    """
+    Resamples recordings to a fixed number of samples with linear interpolation; replaces padding to review_length
+    @param data    : Array of shape (recordings, axes, samples), padded after the length of each recording
+    @param length  : Number of samples after resampling
+    @param lengths : Array with the number of samples of each recording; None if all recordings are complete
+    @param times   : Array of shape (recordings, samples) with the sample times in ms; None for uniform sample times
+    @param rate    : Sample rate in Hz; None to stretch each recording to length samples
+    @param period  : Sample period (in ms) used without times
+    @return        : Array of shape (recordings, axes, length)
+    """
+    data = np.asarray(data)
+    if lengths is None:
+        lengths = np.full(len(data), data.shape[-1])
+    if times is None:
+        times = np.broadcast_to(np.arange(data.shape[-1])*period, (len(data), data.shape[-1]))
+    left, right, weight = resample_indexes(times, lengths, length, rate=rate)
+    left_values = np.take_along_axis(data, left[:, np.newaxis, :], axis=-1)
+    right_values = np.take_along_axis(data, right[:, np.newaxis, :], axis=-1)
+    return left_values+(right_values-left_values)*weight[:, np.newaxis, :]
+
+def load_processed_arrays(f_name, review_length, pad_pos="end"):
+    """
+    Loads acceleration data from a processed array file by memory-mapping it
+    @param f_name        : Array file name (.npy) saved by save_processed_arrays
+    @param review_length : Max number of sample points for acceleration of each axis; padding length
+                           (longer recordings are truncated at the padding side)
+    @param pad_pos       : "start" - Pad at the beginning with initial value
+                           "end"   - Pad at the end with ending value
+    @return              : (data, labels) where data has the shape (3, recordings, 1, review_length)
+    """
+    with span("read file"):
+        array = np.load(f_name, mmap_mode="r")                                  # Shape: (recordings, 3, max length)
+        with np.load(meta_file_name(f_name)) as meta:
+            labels, lengths = meta["labels"], meta["lengths"]
+    if pad_pos.lower() == "end" and review_length == array.shape[-1]:
+        data = array                                                            # Stored layout already matches; no copy
+    else:
+        with span("pad"):                                                       # Includes reading the mapped pages
+            indexes = pad_indexes(lengths, review_length, pad_pos=pad_pos)
+            data = np.take_along_axis(array, indexes[:, np.newaxis, :], axis=-1)
+    return data.transpose(1, 0, 2)[:, :, np.newaxis, :], labels
+
+def load_processed_csv(f_name, review_length, pad_pos="end"):
+    """
+    Loads acceleration data from a processed csv file; all rows are converted and padded in one batch
+    @param f_name        : Processed csv file name
+    @param review_length : Max number of sample points for acceleration of each axis; padding length
+                           (longer recordings are truncated at the padding side)
+    @param pad_pos       : "start" - Pad at the beginning with initial value
+                           "end"   - Pad at the end with ending value
+    @return              : (data, labels) where data has the shape (3, recordings, 1, review_length)
+    """
+    with span("read file"), open(f_name, "r") as csv_file:
+        rows = [row for row in csv_file.read().splitlines() if row]
+    return parse_processed_rows(rows, review_length, pad_pos=pad_pos)
+
+def parse_processed_rows(rows, review_length, pad_pos="end"):
+    """
+    Converts and pads rows of a processed csv file in one batch
+    @param rows          : List of row strings without line breaks
+    @param review_length : Max number of sample points for acceleration of each axis; padding length
+    @param pad_pos       : "start" - Pad at the beginning with initial value
+                           "end"   - Pad at the end with ending value
+    @return              : (data, labels) where data has the shape (3, rows, 1, review_length)
+    """
+    with span("parse"):
+        values = np.array(",".join(rows).split(","), dtype=np.float64)        # All values of all rows in one conversion
+        row_ends = np.cumsum([row.count(",")+1 for row in rows])
+    labels = values[row_ends-1]                                                 # Last value of each row is its label
+    row_starts = np.concatenate(([0], row_ends[:-1]))
+    num_values = row_ends-row_starts-1                                          # Acceleration values of each row
+    # Same 3 parts as uniform_split: part i = [i*interval, min((i+1)*interval, num_values))
+    interval = np.round(num_values/3).astype(np.int64)[:, np.newaxis]
+    parts = np.arange(3)
+    part_starts = parts*interval
+    part_lengths = np.minimum((parts+1)*interval, num_values[:, np.newaxis])-part_starts
+    with span("pad"):
+        indexes = (row_starts[:, np.newaxis]+part_starts)[..., np.newaxis]+pad_indexes(part_lengths, review_length, pad_pos=pad_pos)
+        data = np.empty((3, len(rows), 1, review_length), dtype=np.float64)
+        np.take(values, indexes.transpose(1, 0, 2)[:, :, np.newaxis, :], out=data)
+    return data, labels
+
+def train_test_mask(labels, train_ratio=0.75, seed=None):
+    """
+    Selects an equal amount of training data for each label
+    @param labels      : 1D array with the label of each recording
+    @param train_ratio : Percentage of total data to use for training
+    @param seed        : None to select the first recordings of each label, else seed to select them randomly
+    @return            : Boolean array; True for training data
+    """
+    labels = np.asarray(labels)
+    _, label_indexes = np.unique(labels, return_inverse=True)
+    label_counts = np.bincount(label_indexes)
+    train_amount = round(train_ratio*len(labels)/len(label_counts))            # Amount of training data of each label
+    order = np.arange(len(labels)) if seed is None else np.random.RandomState(seed).permutation(len(labels))
+    order = order[np.argsort(label_indexes[order], kind="stable")]             # Grouped by label, in selection order
+    group_starts = np.repeat(np.cumsum(label_counts)-label_counts, label_counts)
+    rank = np.empty(len(labels), dtype=np.int64)                                # Position of each recording within its label
+    rank[order] = np.arange(len(labels))-group_starts
+    return rank < train_amount
+
+def load_processed_data(f_name, review_length, pad_pos="end", train_ratio=0.75, seed=None):
     """
     Loads acceleration data from processed file
-    @param f_name       : File name
+    @param f_name       : File name; processed csv file or processed array file (.npy)
     @para review_length : Max number of sample points for acceleration of each axis; padding length 
     @param pad_pos      : "start" - Pad at the beginning with initial value
                           "end"   - Pad at the end with ending value
     @param train_ratio  : Percentage of total data to use for training
+    @param seed         : None to use the first recordings of each label for training, else seed to select them randomly
     @return             : (train data, train labels, test data, test labels) where data = acceleration x, y, z and labels = one-hot-encoded labels
     """
-    from keras.utils import to_categorical
-    # Load the csv file, extract data and labels from it and format them
-    with open(f_name, "r") as csv_file:
-        data = [[], [], []]
-        labels = []
-        for row in csv_file:
-            _data = list(map(float, row.split(",")))                # Load acceleration reading as float
-            _data, _label = np.array(_data[: -1]), _data[-1]
-            _data = uniform_split(_data, parts=3)                   # Split acceleration data into 3 equal parts
-            # Pad axis readings and reshape them
-            for i, axis_array in enumerate(_data):
-                axis_array = pad_constant(axis_array, max_length=review_length, pad_pos=pad_pos)
-                axis_array = np.reshape(axis_array, (1, axis_array.shape[0]))
-                data[i].append(axis_array)
-            labels.append(_label)
+    if f_name.endswith(".npy"):
+        data, labels = load_processed_arrays(f_name, review_length, pad_pos=pad_pos)
+    else:
+        data, labels = load_processed_csv(f_name, review_length, pad_pos=pad_pos)
     # Split the data and labels for training and testing
-    label_counter = {label:0 for label in set(labels)}              # Counter for each label saved for training; default count value is zero
-    train_amount = round(train_ratio*len(labels)/len(set(labels)))  # Amount of training data
-    train_indexes = np.zeros(len(labels))                           # Index value of 1 refers to training data
-    for i, label in enumerate(labels):
-        if label_counter[label] < train_amount:
-            label_counter[label] += 1
-            train_indexes[i] = 1
-            if all(count>=train_amount for count in label_counter.values()):
-                # All labels have required amount of training data
-                break
-    train_indexes = (train_indexes == 1)
-    data = np.array(data)
-    labels = to_categorical(labels)
-    return data[:,train_indexes], labels[train_indexes], data[:,~train_indexes], labels[~train_indexes]
+    with span("split"):
+        train_indexes = train_test_mask(labels, train_ratio=train_ratio, seed=seed)
+        labels = np.eye(labels.max()+1, dtype=np.float32)[labels]               # One-hot like keras to_categorical
+        return data[:,train_indexes], labels[train_indexes], data[:,~train_indexes], labels[~train_indexes]
 
 def uniform_split(array, parts=1):
     """
@@ -139,20 +398,67 @@ def uniform_split(array, parts=1):
         array = np.split(array, range(interval, ARRAY_LENGTH, interval))[: parts]
     return array
 
-def load_raw_data(dataframe, cols=None, movingAvgWindow=5, normalizeData=True):
+def load_raw_data(dataframe, cols=None, movingAvgWindow=5, normalizeData=True, length=None, rate=None, normalizeMode="global"):
     """
     Load raw data from given pandas.DataFrame object
     @param dataframe       : Pandas dataframe with data
     @param cols            : Columns of the csv file to load
     @param movingAvgWindow : Window width for the moving average
     @param normalizeData   : True to normalize data
-    @return                : Numpy array after smoothing (and normalizing) the raw data
+    @param length          : Number of samples per column after resampling; None to keep the samples
+    @param rate            : Sample rate (in Hz) of the resampling; None to stretch the recording to length samples.
+                             The sample times are taken from the "t" column if present
+    @param normalizeMode   : "global", "axis" or "standard"; see normalize_axes
+    @return                : Numpy array after smoothing, resampling (and normalizing) the raw data
     """
     if cols is None:
         cols = ("x","y","z")
     # Perform columnwise moving window average on given columns
-    data = np.array([movingAvg(dataframe[col], window=movingAvgWindow) for col in cols])
-    data = data.flatten()
+    with span("smooth"):
+        data = movingAvgBatch(np.array([dataframe[col] for col in cols]), window=movingAvgWindow)
+    if length:
+        with span("resample"):
+            times = np.asarray(dataframe["t"])[np.newaxis] if ("t" in dataframe) else None
+            data = resample_batch(data[np.newaxis], length, times=times, rate=rate)[0]
+    if normalizeData:
+        with span("normalize"):
+            data = normalize_axes(data, mode=normalizeMode)
+    return data.flatten()
+
+def load_raw_batch(recordings, review_length, movingAvgWindow=5, normalizeData=True, pad_pos="start", resample=False,
+                   normalizeMode="global", rate=None):
+    """
+    Vectorized load_raw_data, uniform_split and pad_constant (or resample_batch) for many raw recordings at once
+    @param recordings      : List of arrays of shape (samples, 3) with x, y and z acceleration readings
+    @param review_length   : Length of each axis after padding (longer recordings are truncated at the padding side)
+    @param movingAvgWindow : Window width for the moving average
+    @param normalizeData   : True to normalize each recording
+    @param pad_pos         : "start" - Pad at the beginning with initial value
+                             "end"   - Pad at the end with ending value
+    @param resample        : True to stretch each recording to review_length samples instead of padding
+    @param normalizeMode   : "global", "axis" or "standard"; see normalize_axes
+    @param rate            : Sample rate (in Hz) of the resampling; None to stretch each recording. The samples are
+                             taken as 10 ms apart (the sample period of "Collect Data.py")
+    @return                : Numpy array with the shape (3, recordings, 1, review_length)
+    """
+    lengths = np.array([len(recording) for recording in recordings])
+    with span("smooth"):
+        raw = np.zeros((len(recordings), 3, lengths.max(initial=1)), dtype=np.int64)
+        for i, recording in enumerate(recordings):
+            raw[i, :, :lengths[i]] = np.transpose(recording)
+        data = movingAvgBatch(raw, window=movingAvgWindow, lengths=lengths[:, np.newaxis])
+    if resample:
+        # Same order as load_raw_data: smooth, resample, normalize
+        with span("resample"):
+            data = resample_batch(data, review_length, lengths=lengths, rate=rate)
+        if normalizeData:
+            with span("normalize"):
+                data = normalize_axes(data, mode=normalizeMode)
+        return data.transpose(1, 0, 2)[:, :, np.newaxis, :]
     if normalizeData:
-        data = normalize(data)
-    return data
\ No newline at end of file
+        with span("normalize"):
+            data = normalize_axes(data, mode=normalizeMode, lengths=lengths[:, np.newaxis])
+    with span("pad"):
+        indexes = pad_indexes(lengths, review_length, pad_pos=pad_pos)
+        data = np.take_along_axis(data, indexes[:, np.newaxis, :], axis=-1)
+    return data.transpose(1, 0, 2)[:, :, np.newaxis, :]
@@ -0,0 +1,15 @@
+import os
+import sys
+import importlib.util
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+def load_script(name):
+    """
+    Imports a script of src whose file name is no module name, e.g. "Read Microbit.py"
+    """
+    spec = importlib.util.spec_from_file_location(name.replace(" ", "_"), os.path.join(SRC_DIR, name+".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
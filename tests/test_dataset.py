@@ -0,0 +1,32 @@
+import threading
+import numpy as np
+import pytest
+from Utils import save_processed_arrays
+from Dataset import BatchGenerator
+
+@pytest.fixture
+def data_file(tmp_path):
+    f_name = str(tmp_path/"processed.npy")
+    rng = np.random.RandomState(0)
+    save_processed_arrays(f_name, [rng.rand(3*n) for n in (40, 50, 60, 70)], [0, 1, 2, 3])
+    return f_name
+
+def test_batches(data_file):
+    generator = BatchGenerator(data_file, 50, batch_size=2, shuffle=False)
+    (inputs, labels) = next(generator)
+    generator.close()
+    assert len(inputs) == 3 and inputs[0].shape == (2, 1, 50)
+    assert labels.argmax(axis=1).tolist() == [0, 1]
+
+def test_close_after_error_with_full_queue(data_file):
+    generator = BatchGenerator(data_file, 50, batch_size=2, shuffle=False, prefetch=1)
+    def epoch():
+        for _ in range(2):
+            yield generator._batch(*generator.file.read(generator.rows[:2], 50))
+        raise ValueError("Broken chunk")
+    generator.epoch = epoch
+    next(generator)                                                             # The error waits behind the second batch
+    closing = threading.Thread(target=generator.close, daemon=True)
+    closing.start()
+    closing.join(timeout=5)
+    assert not closing.is_alive()
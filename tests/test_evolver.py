@@ -0,0 +1,57 @@
+import pytest
+import Evolver
+from Evolver import Host
+
+@pytest.fixture
+def trained(monkeypatch, tmp_path):
+    """
+    Replaces the training by a score derived from the parameters; returns the list of (param, epochs) trained
+    """
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    def evaluateHost(param, epochs=5):
+        calls.append((tuple(param), epochs))
+        return sum(param)/1000+epochs/100
+    monkeypatch.setattr(Evolver, "evaluateHost", evaluateHost)
+    monkeypatch.setattr(Evolver, "initWorker", lambda *args: Evolver.DATA.update(ready=True))
+    yield calls
+    Evolver.DATA.clear()
+
+def make_evolver(data_file="data.npy", **kwargs):
+    open(data_file, "a").close()
+    return Evolver.Evolver(data_file, log_file="run.txt", **kwargs)
+
+def run_hosts(evo, params):
+    evo.generateModels(param=[list(param) for param in params])
+    evo.runTest()
+
+def test_rung_scores_are_not_cached_or_averaged(trained):
+    evo = make_evolver(rungs=(1, 5), eta=2)
+    run_hosts(evo, [(1, 1, 1, 1), (2, 2, 2, 2)])
+    assert set(evo.cache.scores) == {(2, 2, 2, 2)}
+    assert evo.cache.epochs((2, 2, 2, 2)) == 5
+    assert evo.scores[-1] == pytest.approx(8/1000+5/100)                         # Only the full budget host
+
+def test_cached_score_of_other_budget_is_trained_again(trained):
+    run_hosts(make_evolver(epochs=3), [(1, 2, 3, 4)])
+    run_hosts(make_evolver(epochs=5), [(1, 2, 3, 4)])
+    assert trained == [((1, 2, 3, 4), 3), ((1, 2, 3, 4), 5)]
+
+def test_resume_restores_epochs_and_caches_full_budget_only(trained):
+    evo = make_evolver(rungs=(1, 2, 5), cache_file=None)
+    evo.hosts = [Host([1, 2, 3, 4], 0.9, 5), Host([5, 6, 7, 8], 0.5, 1), Host([9, 9, 9, 9], 0.6, None)]
+    evo.host_num = 3
+    evo.saveParameters("run.txt", "a")
+    resumed = make_evolver(rungs=(1, 2, 5), cache_file=None)
+    resumed.resume(3)
+    assert set(resumed.cache.scores) == {(1, 2, 3, 4)}
+    assert [host.epochs for host in resumed.hosts] == [5, 1, None]
+    assert resumed.scores == [pytest.approx(0.9)]
+
+def test_cache_is_not_shared_between_settings(trained):
+    run_hosts(make_evolver("data.npy"), [(1, 2, 3, 4)])
+    run_hosts(make_evolver("data.npy"), [(1, 2, 3, 4)])                           # Same settings: cached
+    run_hosts(make_evolver("other.npy"), [(1, 2, 3, 4)])
+    run_hosts(make_evolver("data.npy", epochs=8), [(1, 2, 3, 4)])
+    run_hosts(make_evolver("data.npy", train_ratio=0.5), [(1, 2, 3, 4)])
+    assert [epochs for _, epochs in trained] == [5, 5, 8, 5]
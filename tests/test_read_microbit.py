@@ -0,0 +1,46 @@
+import os
+import pytest
+from conftest import load_script
+
+read_microbit = load_script("Read Microbit")
+
+def failed_transfer(tmp_path, files):
+    """
+    Transfer that fails after verifying the copies but before removing them from the Micro:bit
+    """
+    manifest = read_microbit.TransferManifest(str(tmp_path))
+    backend = read_microbit.FakeBackend(files, fail_after=2)                       # ls, read, then remove fails
+    with pytest.raises(IOError):
+        read_microbit.transfer(backend, "device", manifest, str(tmp_path), "Up")
+    return manifest
+
+def local_files(tmp_path):
+    return {name: (tmp_path/name).read_bytes() for name in os.listdir(str(tmp_path)) if name.endswith(".csv")}
+
+def test_resume_removes_verified_files(tmp_path):
+    files = {"data0.csv": b"x,y,z\n1,2,3\n", "data1.csv": b"x,y,z\n4,5,6\n"}
+    failed_transfer(tmp_path, files)
+    manifest = read_microbit.TransferManifest(str(tmp_path))
+    backend = read_microbit.FakeBackend(files)
+    assert read_microbit.transfer(backend, "device", manifest, str(tmp_path), "Up") == 2
+    assert backend.files == {}
+    assert sorted(local_files(tmp_path).values()) == sorted(files.values())
+
+def test_resume_copies_new_content_of_same_name(tmp_path):
+    files = {"data0.csv": b"x,y,z\n1,2,3\n", "data1.csv": b"x,y,z\n4,5,6\n"}
+    failed_transfer(tmp_path, files)
+    # The Micro:bit recorded a new file with the name (and size) of a verified one
+    rewritten = dict(files, **{"data0.csv": b"x,y,z\n7,8,9\n"})
+    manifest = read_microbit.TransferManifest(str(tmp_path))
+    backend = read_microbit.FakeBackend(rewritten)
+    assert read_microbit.transfer(backend, "device", manifest, str(tmp_path), "Up") == 2
+    assert backend.files == {}
+    copies = sorted(local_files(tmp_path).values())
+    assert copies == sorted([files["data0.csv"], files["data1.csv"], rewritten["data0.csv"]])
+
+def test_verify_detects_truncated_read(tmp_path):
+    f_name = str(tmp_path/"copy.csv")
+    with open(f_name, "wb") as out_file:
+        out_file.write(b"x,y,z\n1,2")
+    with pytest.raises(IOError):
+        read_microbit.verify(f_name, 12, b"x,y,z\n1,2")